@@ -10,17 +10,52 @@ from sphinx_markdown_builder.builder import MarkdownBuilder
 __version__ = "0.6.9"
 __docformat__ = "reStructuredText"
 
+# Name, default value, rebuild, and type of each configuration value
+CONFIG_VALUES = (
+    ("markdown_http_base", "", "html", str),
+    ("markdown_uri_doc_suffix", ".md", "html", str),
+    ("markdown_file_suffix", ".md", "html", str),
+    ("markdown_anchor_sections", False, "html", bool),
+    ("markdown_anchor_signatures", False, "html", bool),
+    ("markdown_docinfo", False, "html", bool),
+    ("markdown_bullet", "*", "html", str),
+    ("markdown_flavor", "", "html", str),
+    ("markdown_write_threads", 0, "", int),
+    ("markdown_reuse_doctrees", False, "", bool),
+    ("markdown_html_outdir", "", "", str),
+    ("markdown_profiles", [], "", list),
+    ("markdown_split_size", 0, "", int),
+    ("markdown_sections_jsonl", "", "", str),
+    ("markdown_offset_index", False, "", bool),
+    ("markdown_archive", "", "", str),
+    ("markdown_copy_assets", False, "", bool),
+    ("markdown_shard", "", "", str),
+    ("markdown_doc_time_limit", 0.0, "", float),
+    ("markdown_doc_size_limit", 0, "", int),
+    ("markdown_node_rules", {}, "", dict),
+    ("markdown_compact", False, "html", bool),
+    ("markdown_check_links", False, "", bool),
+    ("markdown_journal", "", "", str),
+    ("markdown_large_tables", {}, "", dict),
+)
+
+
+def init_markdown_alongside(app):
+    """Writes markdown files alongside the HTML output, if enabled"""
+    if not app.config.markdown_html_outdir or app.builder.format != "html":
+        return
+
+    # Imported only when enabled, same as the builder's translator
+    from sphinx_markdown_builder.alongside import MarkdownAlongside  # pylint: disable=import-outside-toplevel
+
+    MarkdownAlongside(app)
+
 
 def setup(app) -> ExtensionMetadata:
     app.add_builder(MarkdownBuilder)
-    app.add_config_value("markdown_http_base", "", "html", str)
-    app.add_config_value("markdown_uri_doc_suffix", ".md", "html", str)
-    app.add_config_value("markdown_file_suffix", ".md", "html", str)
-    app.add_config_value("markdown_anchor_sections", False, "html", bool)
-    app.add_config_value("markdown_anchor_signatures", False, "html", bool)
-    app.add_config_value("markdown_docinfo", False, "html", bool)
-    app.add_config_value("markdown_bullet", "*", "html", str)
-    app.add_config_value("markdown_flavor", "", "html", str)
+    for name, default, rebuild, types in CONFIG_VALUES:
+        app.add_config_value(name, default, rebuild, types)
+    app.connect("builder-inited", init_markdown_alongside)
 
     return {
         "version": __version__,
@@ -0,0 +1,52 @@
+"""
+Writes markdown files alongside the output of the HTML builders.
+
+The markdown is translated from the same resolved doctrees as the HTML pages,
+so the sources are read once for both formats.
+"""
+
+import os
+
+from docutils import nodes
+from sphinx import addnodes
+from sphinx.application import Sphinx
+from sphinx.util.osutil import os_path
+
+from sphinx_markdown_builder.builder import write_output_file
+from sphinx_markdown_builder.translator import MarkdownTranslator, TranslatorSetup
+
+
+class MarkdownAlongside:
+    def __init__(self, app: Sphinx):
+        config = app.config
+        self.outdir = os.path.normpath(os.path.join(app.outdir, config.markdown_html_outdir))
+        self.out_suffix = config.markdown_file_suffix
+        # Respects a translator that was registered for the markdown builder
+        self.translator_class = app.registry.translators.get("markdown", MarkdownTranslator)
+        self.setup = TranslatorSetup.from_config(config)
+        app.connect("doctree-resolved", self.on_doctree_resolved)
+
+    def render_doc(self, app: Sphinx, doctree: nodes.document, docname: str) -> str:
+        visitor = self.translator_class(doctree, app.builder, docname, self.setup)
+        doctree.walkabout(visitor)
+        return visitor.astext()
+
+    def on_doctree_resolved(self, app: Sphinx, doctree: nodes.document, docname: str):
+        """
+        Emitted in the main process, before the HTML builder translates the doctree (which modifies it).
+        Sphinx resolves the toctrees right after this event. We resolve them first, in the same way,
+        which does not change the HTML output.
+        """
+        for toctree in list(doctree.findall(addnodes.toctree)):
+            result = app.env.resolve_toctree(docname, app.builder, toctree)
+            if result is None:
+                toctree.parent.replace(toctree, [])
+            else:
+                toctree.replace_self(result)
+
+        self.write_doc(app, docname, doctree)
+
+    def write_doc(self, app: Sphinx, docname: str, doctree: nodes.document):
+        output = self.render_doc(app, doctree, docname)
+        out_filename = os.path.join(self.outdir, f"{os_path(docname)}{self.out_suffix}")
+        write_output_file(out_filename, output)
@@ -0,0 +1,126 @@
+"""
+Writes the output files into a single zip or tar.gz archive, instead of the output directory.
+"""
+
+import io
+import multiprocessing
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from typing import Optional, Set
+
+ZIP_SUFFIXES = (".zip",)
+TAR_GZ_SUFFIXES = (".tar.gz", ".tgz")
+
+
+def is_archive_path(path: str) -> bool:
+    return path.endswith(ZIP_SUFFIXES + TAR_GZ_SUFFIXES)
+
+
+def read_member_names(path: str) -> Set[str]:
+    """Returns the names of the archive's members, or an empty set if it does not exist"""
+    if not os.path.exists(path):
+        return set()
+    if path.endswith(ZIP_SUFFIXES):
+        with zipfile.ZipFile(path) as archive:
+            return set(archive.namelist())
+    with tarfile.open(path, "r:gz") as archive:
+        return set(archive.getnames())
+
+
+class ArchiveWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Streams the output files into a new archive, which replaces the previous one when closed.
+    The members of the previous archive that were not written again are copied to the new archive when closed.
+
+    Safe to call `add()` concurrently. In the worker processes of parallel builds, `add()` hands the bytes
+    to the main process, which appends them to the archive in a background thread.
+    """
+
+    def __init__(self, path: str, parallel: bool = False):
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._main_pid = os.getpid()
+        self._lock = threading.Lock()
+        self._written: Set[str] = set()
+        self._error: Optional[BaseException] = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Closed by `close()`
+        # pylint: disable=consider-using-with
+        if path.endswith(ZIP_SUFFIXES):
+            self._zip: Optional[zipfile.ZipFile] = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_DEFLATED)
+            self._tar: Optional[tarfile.TarFile] = None
+        else:
+            self._zip = None
+            self._tar = tarfile.open(self._tmp_path, "w:gz")
+
+        self._queue = None
+        self._receiver = None
+        if parallel:
+            # Sphinx forks its workers, so they inherit the queue
+            self._queue = multiprocessing.get_context("fork").SimpleQueue()
+            self._receiver = threading.Thread(target=self._receive, name="markdown-archive", daemon=True)
+            self._receiver.start()
+
+    def _write(self, name: str, data: bytes):
+        with self._lock:
+            self._written.add(name)
+            if self._zip is not None:
+                self._zip.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data, zipfile.ZIP_DEFLATED)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                info.mode = 0o644
+                self._tar.addfile(info, io.BytesIO(data))
+
+    def _receive(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except BaseException as err:  # pylint: disable=broad-exception-caught
+                # Keep receiving, so the workers are not blocked. The error is raised by `close()`.
+                self._error = self._error or err
+
+    def add(self, name: str, data: bytes):
+        if os.getpid() != self._main_pid:
+            self._queue.put((name, data))
+        else:
+            self._write(name, data)
+
+    def _copy_previous_members(self, deleted: Set[str]):
+        if not os.path.exists(self.path):
+            return
+
+        skipped = self._written | deleted
+        if self._zip is not None:
+            with zipfile.ZipFile(self.path) as previous:
+                for info in previous.infolist():
+                    if info.filename not in skipped:
+                        self._zip.writestr(info, previous.read(info), zipfile.ZIP_DEFLATED)
+        else:
+            with tarfile.open(self.path, "r:gz") as previous:
+                for info in previous:
+                    if info.name not in skipped:
+                        self._tar.addfile(info, previous.extractfile(info) if info.isfile() else None)
+
+    def close(self, deleted: Optional[Set[str]] = None):
+        """
+        Waits for the workers' files, and replaces the previous archive.
+        The previous archive's members that are not written again are kept, except for the `deleted` ones.
+        """
+        if self._receiver is not None:
+            self._queue.put(None)
+            self._receiver.join()
+        if self._error is not None:
+            raise self._error
+
+        self._copy_previous_members(deleted or set())
+        (self._zip or self._tar).close()
+        os.replace(self._tmp_path, self.path)
@@ -0,0 +1,156 @@
+"""
+Copies the images and the downloadable files that the documents reference into the output directories.
+"""
+
+import hashlib
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sphinx.locale import __
+from sphinx.util import logging
+from sphinx.util.osutil import ensuredir
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+@dataclass(frozen=True)
+class Asset:
+    source: str  # The path of the source file
+    target: str  # The path in the output directory (with "/" separators)
+
+
+@dataclass
+class CopyStats:
+    copied: int = 0
+    linked: int = 0
+    skipped: int = 0
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def get_content_keys(sources: List[str], executor: ThreadPoolExecutor) -> Dict[str, Tuple[int, str]]:
+    """
+    Returns a key for each source file, which is equal for files with identical content.
+    Only files whose size equals another file's size are hashed.
+    """
+    sizes = dict(zip(sources, executor.map(os.path.getsize, sources)))
+    by_size = defaultdict(list)
+    for source, size in sizes.items():
+        by_size[size].append(source)
+
+    colliding = [source for same_size in by_size.values() if len(same_size) > 1 for source in same_size]
+    hashes = dict(zip(colliding, executor.map(hash_file, colliding)))
+    return {source: (size, hashes.get(source, source)) for source, size in sizes.items()}
+
+
+def is_up_to_date(source: str, dest: str) -> bool:
+    """Compares the sizes and the modification times, and the content if only the modification times differ"""
+    source_stat = os.stat(source)
+    dest_stat = _stat(dest)
+    if dest_stat is None or dest_stat.st_size != source_stat.st_size:
+        return False
+    if dest_stat.st_mtime >= source_stat.st_mtime:
+        return True
+    if hash_file(source) != hash_file(dest):
+        return False
+    # Unchanged content (e.g., the source was touched), so the next build can skip it by its modification time
+    os.utime(dest, (dest_stat.st_atime, source_stat.st_mtime))
+    return True
+
+
+def copy_file(source: str, dest: str) -> bool:
+    """Copies the file, unless it is up to date. Returns whether it was copied."""
+    if is_up_to_date(source, dest):
+        return False
+
+    ensuredir(os.path.dirname(dest))
+    # Replaces the file, rather than overwriting it, as it might be linked to other files
+    tmp_dest = f"{dest}.tmp"
+    shutil.copy2(source, tmp_dest)
+    os.replace(tmp_dest, dest)
+    return True
+
+
+def link_file(original: str, dest: str) -> bool:
+    """Hard links the file to an identical file, or copies it if links are not supported. Returns whether it linked."""
+    if os.path.exists(dest) and os.path.samefile(original, dest):
+        return False
+
+    ensuredir(os.path.dirname(dest))
+    tmp_dest = f"{dest}.tmp"
+    try:
+        os.link(original, tmp_dest)
+    except OSError:
+        shutil.copy2(original, tmp_dest)
+    os.replace(tmp_dest, dest)
+    return True
+
+
+def _copy_or_link(args: Tuple[str, str, str]) -> str:
+    """Returns the `CopyStats` counter of the result"""
+    action, source, dest = args
+    try:
+        if action == "copy":
+            return "copied" if copy_file(source, dest) else "skipped"
+        return "linked" if link_file(source, dest) else "skipped"
+    except OSError as err:
+        logger.warning(__("cannot copy asset %s to %s: %s"), source, dest, err)
+        return "skipped"
+
+
+def _plan_actions(assets: List[Asset], outdirs: List[str], content_keys: Dict[str, Tuple[int, str]]):
+    """Returns the files to copy, and the files to link to the copies of identical files"""
+    originals: Dict[Tuple[int, str], str] = {}
+    copies = []
+    links = []
+    for outdir in outdirs:
+        for asset in assets:
+            if asset.source not in content_keys:
+                continue
+            dest = os.path.join(outdir, *asset.target.split("/"))
+            original = originals.setdefault(content_keys[asset.source], dest)
+            if original == dest:
+                copies.append(("copy", asset.source, dest))
+            else:
+                links.append(("link", original, dest))
+    return copies, links
+
+
+def copy_assets(assets: List[Asset], outdirs: List[str]) -> CopyStats:
+    """
+    Copies the assets into each output directory, in a thread pool.
+    Files with identical content are copied once, and hard linked to the copy.
+    """
+    sources = sorted({asset.source for asset in assets})
+    for source in sources:
+        if not os.path.isfile(source):
+            logger.warning(__("cannot copy missing asset: %s"), source)
+    sources = [source for source in sources if os.path.isfile(source)]
+
+    stats = CopyStats()
+    with ThreadPoolExecutor(thread_name_prefix="markdown-assets") as executor:
+        content_keys = get_content_keys(sources, executor)
+        # The originals are copied before they are linked
+        for actions in _plan_actions(assets, outdirs, content_keys):
+            for result in executor.map(_copy_or_link, actions):
+                setattr(stats, result, getattr(stats, result) + 1)
+    return stats
@@ -2,21 +2,40 @@
 Custom docutils builder for markdown.
 """
 
+import dataclasses
+import heapq
+import json
 import os
+import posixpath
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Set
+from typing import TYPE_CHECKING, Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple, Type
 
 from docutils import nodes
 from docutils.io import StringOutput
+from sphinx import addnodes
 from sphinx.application import Sphinx
 from sphinx.builders import Builder
 from sphinx.environment import BuildEnvironment
+from sphinx.errors import ConfigError
 from sphinx.locale import __
 from sphinx.util import logging
 from sphinx.util.osutil import ensuredir, os_path
+from sphinx.util.parallel import make_chunks
 
-from sphinx_markdown_builder.translator import MarkdownTranslator
-from sphinx_markdown_builder.writer import MarkdownWriter
+# The translator, its contexts and tabulate are only imported once the markdown builder is used.
+# This keeps the registration of the extension cheap for the other builders.
+# pylint: disable=import-outside-toplevel
+if TYPE_CHECKING:  # pragma: no cover
+    from sphinx_markdown_builder.archive import ArchiveWriter
+    from sphinx_markdown_builder.assets import Asset
+    from sphinx_markdown_builder.journal import OutputRecordsWriter
+    from sphinx_markdown_builder.links import LinkIndexWriter, SplitLinkRewriter
+    from sphinx_markdown_builder.sections import SectionRecordsWriter, SplitFile
+    from sphinx_markdown_builder.translator import MarkdownTranslator, TranslatorSetup
+    from sphinx_markdown_builder.writer import MarkdownWriter
 
 logger = logging.getLogger(__name__)
 
@@ -30,50 +49,427 @@ def io_handler(file_path: str, log_error=True):
             logger.warning(__("error accessing file %s: %s"), file_path, err)
 
 
+def write_output_file(out_filename: str, output: str, make_dirs: bool = True):
+    if make_dirs:
+        ensuredir(os.path.dirname(out_filename))
+
+    with io_handler(out_filename):
+        with open(out_filename, "w", encoding="utf-8") as file:
+            file.write(output)
+
+
+def read_output_file(out_filename: str) -> Optional[str]:
+    with io_handler(out_filename):
+        with open(out_filename, encoding="utf-8") as file:
+            return file.read()
+    return None
+
+
 def get_mod_time_if_exists(file_path, log_error=True):
     with io_handler(file_path, log_error):
         return os.path.getmtime(file_path)
 
 
-class MarkdownBuilder(Builder):
+def get_size_if_exists(file_path, log_error=False):
+    with io_handler(file_path, log_error):
+        return os.path.getsize(file_path)
+
+
+class MtimeIndex:  # pylint: disable=too-few-public-methods
+    """
+    Caches the modification times of the files of each directory, which is scanned once, when first queried.
+    Missing files (and directories) are known from the scan, without probing each of them.
+    """
+
+    def __init__(self):
+        self._dirs: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def _scan(dir_path: str) -> Dict[str, float]:
+        mtimes = {}
+        with io_handler(dir_path, log_error=False):
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    with io_handler(entry.path, log_error=False):
+                        if entry.is_file():
+                            mtimes[entry.name] = entry.stat().st_mtime
+        return mtimes
+
+    def get(self, file_path: str) -> Optional[float]:
+        """Returns the modification time of the file, or None if it does not exist"""
+        dir_path, name = os.path.split(os.path.abspath(file_path))
+        mtimes = self._dirs.get(dir_path)
+        if mtimes is None:
+            mtimes = self._dirs[dir_path] = self._scan(dir_path)
+        return mtimes.get(name)
+
+
+def prune_elements(node: nodes.Node, elements: FrozenSet[str]):
+    """Removes the subtrees of the given element types"""
+    children = [child for child in node.children if child.__class__.__name__ not in elements]
+    if len(children) != len(node.children):
+        node.children[:] = children
+    for child in children:
+        prune_elements(child, elements)
+
+
+def is_top_level_block(node: nodes.Node) -> bool:
+    """Whether the node is a block of the document's or a section's own content (e.g., not a nested section)"""
+    if isinstance(node, (nodes.section, nodes.title)):
+        return False
+    return isinstance(node, nodes.Element) and isinstance(node.parent, (nodes.section, nodes.document))
+
+
+def measure_doctree(doctree: nodes.document) -> Tuple[int, Optional[str]]:
+    """Returns the number of elements in the doctree, and the type of its largest block (outside of the sections)"""
+    size = sum(1 for _ in doctree.findall(nodes.Element))
+    blocks = doctree.findall(is_top_level_block)
+    largest = max(blocks, key=lambda block: sum(1 for _ in block.findall(nodes.Element)), default=None)
+    return size, largest.__class__.__name__ if largest is not None else None
+
+
+def make_plain_doctree(doctree: nodes.document) -> nodes.document:
+    """Makes a doctree that has the text of the document in a literal block, under the document's title"""
+    plain_doctree = parent = doctree.copy()
+    section = doctree.next_node(nodes.section)
+    if section is None or not section.children or not isinstance(section[0], nodes.title):
+        section = None
+    else:
+        parent = nodes.section("", section[0].deepcopy(), ids=section["ids"], names=section["names"])
+        plain_doctree += parent
+
+    parts = []
+    for child in doctree.children:
+        # Without the title, which was kept
+        parts.extend(child.children[1:] if child is section else [child])
+    text = "\n\n".join(part.astext() for part in parts)
+    parent += nodes.literal_block(text, text)
+    return plain_doctree
+
+
+def schedule_by_cost(docnames: Sequence[str], get_cost: Callable[[str], int], nproc: int) -> List[str]:
+    """
+    Orders the documents such that Sphinx's parallel writer dispatches chunks with balanced costs.
+
+    Sphinx writes the first document in the main process, and splits the rest into consecutive chunks
+    (see `sphinx.util.parallel.make_chunks`). We keep the same chunk sizes, but fill them with the
+    most expensive documents first, each going to the chunk with the lowest total cost so far.
+    Thus, the expensive documents are spread across the chunks, and are dispatched first.
+    """
+    if len(docnames) <= 1:
+        return list(docnames)
+
+    costs = {docname: get_cost(docname) for docname in docnames}
+    # Sort by name as well to keep the schedule deterministic
+    ordered = sorted(docnames, key=lambda d: (-costs[d], d))
+    # The main process should not delay dispatching the chunks
+    first = ordered.pop()
+
+    sizes = [len(chunk) for chunk in make_chunks(ordered, nproc)]
+    chunks: List[List[str]] = [[] for _ in sizes]
+    heap = [(0, i) for i in range(len(chunks))]
+    for docname in ordered:
+        load, i = heapq.heappop(heap)
+        chunks[i].append(docname)
+        if len(chunks[i]) < sizes[i]:
+            heapq.heappush(heap, (load + costs[docname], i))
+
+    return [first, *(docname for chunk in chunks for docname in chunk)]
+
+
+# The markdown configuration values (without the `markdown_` prefix) that an output profile can override
+PROFILE_KEYS = (
+    "http_base",
+    "uri_doc_suffix",
+    "file_suffix",
+    "anchor_sections",
+    "anchor_signatures",
+    "docinfo",
+    "bullet",
+    "flavor",
+)
+
+
+# The image types that markdown renderers usually support, by order of preference
+ASSET_IMAGE_TYPES = ("image/svg+xml", "image/png", "image/gif", "image/jpeg")
+IMAGES_DIR = "_images"
+DOWNLOADS_DIR = "_downloads"
+
+
+class ProfileConfig:  # pylint: disable=too-few-public-methods
+    """The configuration, with the markdown configuration values of an output profile"""
+
+    def __init__(self, config, profile: Dict[str, Any]):
+        self._config = config
+        self._overrides = {f"markdown_{key}": value for key, value in profile.items() if key in PROFILE_KEYS}
+
+    def __getattr__(self, name: str):
+        overrides = self.__dict__.get("_overrides", {})
+        if name in overrides:
+            return overrides[name]
+        return getattr(self.__dict__["_config"], name)
+
+
+@dataclasses.dataclass(frozen=True)
+class OutputProfile:
+    """A variant of the markdown output, written to its own directory"""
+
+    outdir: str
+    file_suffix: str
+    config: Any  # The configuration, or a `ProfileConfig`
+    setup: Optional["TranslatorSetup"] = None  # Set before writing, unless it is the builder's setup
+    section_records: Optional["SectionRecordsWriter"] = None  # Set before writing, if enabled
+    link_index: Optional["LinkIndexWriter"] = None  # Set before writing, if enabled
+
+    def get_out_filename(self, docname: str) -> str:
+        return os.path.join(self.outdir, f"{os_path(docname)}{self.file_suffix}")
+
+
+def make_output_profiles(config, outdir: str) -> List[OutputProfile]:
+    """Parses `markdown_profiles`. Without profiles, there is a single output with the configuration's values."""
+    if not config.markdown_profiles:
+        return [OutputProfile(outdir, config.markdown_file_suffix, config)]
+
+    profiles = []
+    for profile in config.markdown_profiles:
+        unknown = set(profile) - {"outdir", *PROFILE_KEYS}
+        if unknown:
+            raise ConfigError(__("Unknown markdown_profiles keys: %s") % ", ".join(sorted(unknown)))
+        profile_config = ProfileConfig(config, profile)
+        profile_outdir = os.path.normpath(os.path.join(outdir, profile.get("outdir", "")))
+        profiles.append(OutputProfile(profile_outdir, profile_config.markdown_file_suffix, profile_config))
+
+    targets = {(profile.outdir, profile.file_suffix) for profile in profiles}
+    if len(targets) != len(profiles):
+        raise ConfigError(__("markdown_profiles must have distinct output directories or file suffixes"))
+    return profiles
+
+
+class ThreadedWriter:
+    """
+    Writes documents in a thread pool, while the main thread keeps resolving the next doctrees.
+    Translation only scales across cores on free-threaded Python builds.
+    """
+
+    def __init__(self, write: Callable[[str, nodes.document], None], threads: int):
+        self._write = write
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="markdown-writer")
+        # Bounds the number of resolved doctrees that are waiting to be written
+        self._pending = threading.BoundedSemaphore(2 * threads)
+        self._futures: List[Future] = []
+
+    def add(self, docname: str, doctree: nodes.document):
+        self._pending.acquire()  # pylint: disable=consider-using-with
+        future = self._executor.submit(self._write, docname, doctree)
+        future.add_done_callback(lambda _: self._pending.release())
+        self._futures.append(future)
+
+    def join(self):
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            # Raises the exception of a failed write, if any
+            future.result()
+
+
+class DefaultTranslatorClass:  # pylint: disable=too-few-public-methods
+    """Resolves to `MarkdownTranslator` on first access, from both the builder class and its instances"""
+
+    def __get__(self, instance, owner=None) -> "Type[MarkdownTranslator]":
+        from sphinx_markdown_builder.translator import MarkdownTranslator
+
+        return MarkdownTranslator
+
+
+class MarkdownBuilder(Builder):  # pylint: disable=too-many-instance-attributes
     name = "markdown"
     format = "markdown"
     epilog = __("The markdown files are in %(outdir)s.")
 
     allow_parallel = True
-    default_translator_class = MarkdownTranslator
+    default_translator_class = DefaultTranslatorClass()
 
     out_suffix = ".md"
 
     def __init__(self, app: Sphinx, env: BuildEnvironment = None):
         super().__init__(app, env)
-        self.writer = None
-        self.sec_numbers = None
-        self.current_doc_name = None
+        self.threaded_writer: Optional[ThreadedWriter] = None
+        self.skipped_elements: FrozenSet[str] = frozenset()
+        self.translator_setup: Optional["TranslatorSetup"] = None
+        self.profiles: List[OutputProfile] = []
+        self.archive: Optional["ArchiveWriter"] = None
+        self.archive_path: Optional[str] = None
+        self.archive_members: Set[str] = set()
+        self.shard: Optional[Tuple[int, int]] = None
+        self._referenced_ids: Optional[FrozenSet[str]] = None
+        self.output_records: Optional["OutputRecordsWriter"] = None
+        # The documents that were removed since the previous build
+        self.removed_docnames: Set[str] = set()
+        # The documents that are read by this build
+        self._read_docnames: List[str] = []
 
     def init(self):
-        self.sec_numbers = {}
+        self.init_translation()
+        self.profiles = make_output_profiles(self.config, self.outdir)
+        if self.config.markdown_archive:
+            self._init_archive()
+        if self.config.markdown_copy_assets:
+            # Used to pick the image of each `image.*` pattern
+            self.supported_image_types = list(ASSET_IMAGE_TYPES)
+        self.events.connect("env-get-outdated", self._on_get_outdated, 500)
+        if self.config.markdown_reuse_doctrees:
+            self.events.connect("env-before-read-docs", self._skip_reading_pickled_docs, 500)
+        if any(profile.config.markdown_compact for profile in self.profiles):
+            self._init_references()
+        if self.config.markdown_shard:
+            from sphinx_markdown_builder.shards import parse_shard
+
+            try:
+                self.shard = parse_shard(self.config.markdown_shard)
+            except ValueError as err:
+                raise ConfigError(str(err)) from err
+            if self.config.markdown_archive:
+                # The merge combines the shards' output trees, and reads their manifests
+                raise ConfigError(__("markdown_shard cannot be used with markdown_archive"))
+
+    def init_translation(self):
+        """
+        Initializes only what the translation needs, without connecting to the build's events.
+        Used on its own to render with the application of another builder.
+        """
         self.out_suffix = self.config.markdown_file_suffix
+        self._check_translator_config()
+
+    def _init_archive(self):
+        from sphinx_markdown_builder.archive import is_archive_path, read_member_names
+
+        if not is_archive_path(self.config.markdown_archive):
+            raise ConfigError(__("markdown_archive must end with .zip, .tar.gz or .tgz"))
+        self.archive_path = os.path.join(self.outdir, self.config.markdown_archive)
+        self.archive_members = read_member_names(self.archive_path)
 
-    def _get_source_mtime(self, doc_name: str):
+    def _init_references(self):
+        """Collects the references of the documents while they are read, only for the compact output"""
+        from sphinx_markdown_builder.references import on_doctree_read, on_env_merge_info, on_env_purge_doc
+
+        self.events.connect("doctree-read", on_doctree_read, 500)
+        self.events.connect("env-purge-doc", on_env_purge_doc, 500)
+        self.events.connect("env-merge-info", on_env_merge_info, 500)
+        # After the documents to read are filtered by `_skip_reading_pickled_docs()`
+        self.events.connect("env-before-read-docs", self._on_before_read_docs, 900)
+        self.events.connect("env-updated", self._set_references_read_times, 500)
+
+    def _on_before_read_docs(self, _app: Sphinx, _env: BuildEnvironment, docnames: List[str]):
+        self._read_docnames = list(docnames)
+
+    def _set_references_read_times(self, _app: Sphinx, env: BuildEnvironment) -> List[str]:
+        from sphinx_markdown_builder.references import set_read_times
+
+        set_read_times(env, self._read_docnames)
+        return []
+
+    def _check_translator_config(self):
+        """Reports the invalid configuration values of the translator before reading the sources"""
+        if not self.config.markdown_node_rules and not self.config.markdown_large_tables:
+            return
+
+        from sphinx_markdown_builder.translator import check_node_rules, make_table_limits
+
+        try:
+            check_node_rules(self.config.markdown_node_rules)
+            make_table_limits(self.config.markdown_large_tables)
+        except ValueError as err:
+            raise ConfigError(str(err)) from err
+
+    def _in_shard(self, doc_name: str) -> bool:
+        """Whether this shard writes the document (all the documents, unless sharded)"""
+        from sphinx_markdown_builder.shards import get_doc_shard
+
+        return self.shard is None or get_doc_shard(doc_name, self.shard[1]) == self.shard[0]
+
+    def _get_member_name(self, out_filename: str) -> str:
+        return os.path.relpath(out_filename, self.outdir).replace(os.path.sep, "/")
+
+    def _get_source_mtime(self, doc_name: str, mtime_index: MtimeIndex):
         source_name = self.env.doc2path(doc_name)
-        return get_mod_time_if_exists(source_name)
+        source_mtime = mtime_index.get(source_name)
+        if source_mtime is None:
+            # Logs the reason
+            return get_mod_time_if_exists(source_name)
+        return source_mtime
+
+    def _get_target_mtime(self, doc_name: str, mtime_index: MtimeIndex):
+        """Returns the modification time of the oldest output of the document, if all the outputs exist"""
+        if self.archive_path is not None:
+            out_filenames = (profile.get_out_filename(doc_name) for profile in self.profiles)
+            if all(self._get_member_name(out_filename) in self.archive_members for out_filename in out_filenames):
+                return mtime_index.get(self.archive_path)
+            return None
+
+        target_mtimes = []
+        for profile in self.profiles:
+            target_mtime = mtime_index.get(profile.get_out_filename(doc_name))
+            if target_mtime is None:
+                return None
+            target_mtimes.append(target_mtime)
+        return min(target_mtimes)
 
-    def _get_target_mtime(self, doc_name: str):
-        target_name = os.path.join(self.outdir, doc_name + self.out_suffix)
-        return get_mod_time_if_exists(target_name, log_error=False)
+    def _on_get_outdated(self, _app: Sphinx, _env: BuildEnvironment, _added, _changed, removed: Set[str]) -> List[str]:
+        """Keeps the removed documents, whose output files are deleted by `finish()`"""
+        self.removed_docnames = set(removed)
+        return []
+
+    def _skip_reading_pickled_docs(self, _app: Sphinx, env: BuildEnvironment, docnames: List[str]):
+        """
+        Reads only the new sources, when configured to reuse an existing environment (e.g., of a previous HTML build).
+        The documents that have an up-to-date pickled doctree are only resolved and written.
+        """
+        pickled = {docname for docname in docnames if docname in env.all_docs and self._is_doctree_current(docname)}
+        if pickled:
+            logger.info(__("reusing the pickled environment and doctrees of %d documents"), len(pickled))
+            docnames[:] = [docname for docname in docnames if docname not in pickled]
+
+    def _is_doctree_current(self, docname: str) -> bool:
+        """Whether the pickled doctree is newer than the document's source, and than the files it depends on"""
+        doctree_mtime = get_mod_time_if_exists(os.path.join(self.doctreedir, f"{docname}.doctree"), log_error=False)
+        if doctree_mtime is None:
+            return False
+        paths = [self.env.doc2path(docname)]
+        paths.extend(os.path.join(self.srcdir, dependency) for dependency in self.env.dependencies.get(docname, ()))
+        for path in paths:
+            source_mtime = get_mod_time_if_exists(path, log_error=False)
+            if source_mtime is None or source_mtime > doctree_mtime:
+                return False
+        return True
 
     def get_outdated_docs(self):
+        # Each source and output directory is scanned once, rather than probing each file
+        mtime_index = MtimeIndex()
         for doc_name in self.env.found_docs:
+            if not self._in_shard(doc_name):
+                continue
             if doc_name not in self.env.all_docs:
                 yield doc_name
                 continue
 
-            source_mtime = self._get_source_mtime(doc_name)
-            target_mtime = self._get_target_mtime(doc_name)
+            source_mtime = self._get_source_mtime(doc_name, mtime_index)
+            target_mtime = self._get_target_mtime(doc_name, mtime_index)
             if source_mtime is None or target_mtime is None or source_mtime > target_mtime:
                 yield doc_name
 
+    def _get_doc_cost(self, doc_name: str) -> int:
+        """Estimates the cost of writing a document by the size of its pickled doctree"""
+        doctree_name = os.path.join(self.doctreedir, f"{os_path(doc_name)}.doctree")
+        return get_size_if_exists(doctree_name) or 0
+
+    def _write_serial(self, docnames: Sequence[str]):
+        # Sphinx also writes the documents that were read, including those of the other shards
+        super()._write_serial([docname for docname in docnames if self._in_shard(docname)])
+
+    def _write_parallel(self, docnames: Sequence[str], nproc: int):
+        docnames = [docname for docname in docnames if self._in_shard(docname)]
+        if docnames:
+            super()._write_parallel(schedule_by_cost(docnames, self._get_doc_cost, nproc), nproc)
+
     def get_target_uri(self, docname: str, typ: str = None):
         """
         Returns the target file name.
@@ -82,17 +478,453 @@ class MarkdownBuilder(Builder):
         """
         return f"{docname}{self.config.markdown_uri_doc_suffix}"
 
+    def prepare_translator(self):
+        """Prepares the translation of the documents, once for all of them"""
+        from sphinx_markdown_builder.translator import TranslatorSetup, get_skipped_elements
+
+        # Collected again for each build, as the documents' references may have changed
+        self._referenced_ids = None
+        self.translator_setup = self._add_referenced_ids(TranslatorSetup.from_config(self.config))
+        # The subtrees of the elements that are skipped by the configuration are pruned too
+        node_rules = self.translator_setup.node_rules
+        skipped_elements = get_skipped_elements(self.get_translator_class()) - set(node_rules)
+        self.skipped_elements = skipped_elements | {element for element, rule in node_rules.items() if rule == "skip"}
+
+    def _add_referenced_ids(self, setup: "TranslatorSetup") -> "TranslatorSetup":
+        """The compact output omits the anchors that are not referenced by any document"""
+        if not setup.compact:
+            return setup
+        if self._referenced_ids is None:
+            from sphinx_markdown_builder.references import get_referenced_ids, update_references
+
+            update_references(self.env)
+            self._referenced_ids = get_referenced_ids(self.env)
+        return dataclasses.replace(setup, referenced_ids=self._referenced_ids)
+
     def prepare_writing(self, docnames: Set[str]):
-        self.writer = MarkdownWriter(self)
+        docnames = {docname for docname in docnames if self._in_shard(docname)}
+        self.prepare_translator()
+        self.profiles = [
+            dataclasses.replace(
+                profile,
+                setup=self._make_profile_setup(profile),
+                section_records=self._make_section_records(profile, docnames),
+                link_index=self._make_link_index(index, profile, docnames),
+            )
+            for index, profile in enumerate(self.profiles)
+        ]
+        if self.archive_path is not None:
+            from sphinx_markdown_builder.archive import ArchiveWriter
 
-    def write_doc(self, docname: str, doctree: nodes.document):
-        self.current_doc_name = docname
-        self.sec_numbers = self.env.toc_secnumbers.get(docname, {})
+            self.archive = ArchiveWriter(self.archive_path, parallel=self.parallel_ok)
+        else:
+            self._make_out_dirs(docnames)
+        if self.config.markdown_journal:
+            self.output_records = self._make_output_records(docnames)
+        threads = self.config.markdown_write_threads
+        # Parallel (multiprocess) builds call write_doc() in the worker processes
+        if threads > 1 and not self.parallel_ok:
+            self.threaded_writer = ThreadedWriter(self._write_doc, threads)
+
+    def _make_out_dirs(self, docnames: Set[str]):
+        """Creates the output directories once, before the documents are written (in the worker processes)"""
+        out_dirs = {
+            os.path.dirname(profile.get_out_filename(docname)) for profile in self.profiles for docname in docnames
+        }
+        for out_dir in sorted(out_dirs):
+            ensuredir(out_dir)
+
+    def _make_profile_setup(self, profile: OutputProfile) -> Optional["TranslatorSetup"]:
+        from sphinx_markdown_builder.translator import TranslatorSetup
+
+        if profile.config is self.config:
+            return None
+
+        setup = self._add_referenced_ids(TranslatorSetup.from_config(profile.config))
+        # The references were resolved with the builder's document suffix
+        uri_doc_suffix = self.config.markdown_uri_doc_suffix
+        if profile.config.markdown_uri_doc_suffix != uri_doc_suffix:
+            setup = dataclasses.replace(
+                setup, replace_uri_doc_suffix=(uri_doc_suffix, profile.config.markdown_uri_doc_suffix)
+            )
+        return setup
+
+    def _make_records_filter(self, docnames: Set[str]) -> Callable[[str], bool]:
+        """Keeps the records of the previous build of the documents that are up to date (not written again)"""
+        return lambda docname: docname in self.env.found_docs and docname not in docnames
+
+    def _make_section_records(self, profile: OutputProfile, docnames: Set[str]) -> Optional["SectionRecordsWriter"]:
+        from sphinx_markdown_builder.sections import SectionRecordsWriter
+
+        if not self.config.markdown_sections_jsonl:
+            return None
+
+        path = os.path.join(profile.outdir, self.config.markdown_sections_jsonl)
+        return SectionRecordsWriter(path, self._make_records_filter(docnames))
+
+    def _make_output_records(self, docnames: Set[str]) -> "OutputRecordsWriter":
+        from sphinx_markdown_builder.journal import OutputRecordsWriter
+
+        # Build state, same as the link index
+        path = os.path.join(self.doctreedir, "markdown-outputs.jsonl")
+        return OutputRecordsWriter(path, self._make_records_filter(docnames))
+
+    def _finish_output_records(self) -> List[str]:
+        """Writes the journal, and returns the files that were not written again (e.g., of removed documents)"""
+        from sphinx_markdown_builder.journal import make_journal
+
+        records = self.output_records
+        self.output_records = None
+        journal = make_journal(records.previous, records.kept, records.get_files())
+        write_output_file(os.path.join(self.outdir, self.config.markdown_journal), json.dumps(journal, indent=1))
+        return journal["deleted"]
+
+    def _list_output_dir(self, out_dir: str) -> List[str]:
+        """Returns the names of the files in an output directory, or of the archive's members in it"""
+        if self.archive is None:
+            return os.listdir(out_dir) if os.path.isdir(out_dir) else []
+        out_dir = os.path.normpath(out_dir)
+        return [
+            posixpath.basename(name)
+            for name in self.archive_members
+            if os.path.normpath(os.path.join(self.outdir, os.path.dirname(os_path(name)))) == out_dir
+        ]
+
+    def _find_removed_outputs(self) -> List[str]:
+        """Returns the output files of the documents that were removed since the previous build"""
+        from sphinx_markdown_builder.journal import make_output_pattern
+
+        names = []
+        for profile in self.profiles:
+            for docname in sorted(self.removed_docnames):
+                out_dir = os.path.dirname(profile.get_out_filename(docname))
+                pattern = make_output_pattern(os.path.basename(os_path(docname)), profile.file_suffix)
+                names.extend(
+                    self._get_member_name(os.path.join(out_dir, name))
+                    for name in self._list_output_dir(out_dir)
+                    if pattern.fullmatch(name)
+                )
+        return names
+
+    def _delete_outputs(self, names: List[str]):
+        """Deletes the output files that are not written anymore (an archive skips them when it is closed)"""
+        if self.archive is not None:
+            return
+        for name in names:
+            path = os.path.join(self.outdir, *name.split("/"))
+            with io_handler(path, log_error=False):
+                os.remove(path)
+
+    def _rewrites_split_links(self, profile: OutputProfile) -> bool:
+        """Whether the links to the split documents are rewritten (not in an archive, nor links to other pages)"""
+        if self.config.markdown_split_size <= 0 or self.archive_path is not None:
+            return False
+        return not profile.config.markdown_http_base and profile.config.markdown_uri_doc_suffix == profile.file_suffix
+
+    def _make_link_index(self, index: int, profile: OutputProfile, docnames: Set[str]) -> Optional["LinkIndexWriter"]:
+        from sphinx_markdown_builder.links import LinkIndexWriter
+
+        if not self.config.markdown_check_links and not self._rewrites_split_links(profile):
+            return None
+
+        # The index is build state (rather than an output), so it is kept with the doctrees
+        path = os.path.join(self.doctreedir, "markdown-links", f"{index}.jsonl")
+        return LinkIndexWriter(path, self._make_records_filter(docnames))
+
+    def _check_links(self, link_index: "LinkIndexWriter"):
+        from sphinx_markdown_builder.links import find_broken_links
+
+        broken = find_broken_links(link_index.index, self.env.found_docs, self.config.markdown_uri_doc_suffix)
+        for docname, link in broken:
+            logger.warning(__("broken link to %s (no such anchor)"), link, location=docname)
+
+    def _close_records(self):
+        """Merges the records of the worker processes, then rewrites the links to the split documents"""
+        for profile in self.profiles:
+            if profile.section_records is not None:
+                profile.section_records.close()
+        if self.output_records is not None:
+            self.output_records.close()
+        for profile in self.profiles:
+            if profile.link_index is not None:
+                self._finish_link_index(profile)
+
+    def _finish_link_index(self, profile: OutputProfile):
+        profile.link_index.close()
+        if self._rewrites_split_links(profile):
+            self._rewrite_split_links(profile)
+        if self.config.markdown_check_links:
+            self._check_links(profile.link_index)
+
+    def _rewrite_split_links(self, profile: OutputProfile):
+        """Points the links to the anchors of the split documents into the file of their anchor"""
+        from sphinx_markdown_builder.links import SplitLinkRewriter, get_anchor_files, get_split_link_docs
+
+        index = profile.link_index.index
+        anchor_files = get_anchor_files(index)
+        rewriter = SplitLinkRewriter(set(index), anchor_files, profile.file_suffix)
+        modified: Set[str] = set()
+        rewritten = {}
+        for docname in get_split_link_docs(index, anchor_files, self.config.markdown_uri_doc_suffix):
+            targets = self._rewrite_doc_links(profile, docname, rewriter, modified)
+            if targets != index[docname].rewritten:
+                rewritten[docname] = targets
+        profile.link_index.set_rewritten(rewritten)
+
+        if profile.section_records is not None:
+
+            def update(record: Dict[str, Any]) -> Dict[str, Any]:
+                body = rewriter.rewrite(record["docname"], record["body"])[0]
+                return {**record, "body": body, "length": len(body.encode("utf-8"))}
+
+            profile.section_records.update_records(modified, update)
+
+    def _rewrite_doc_links(
+        self, profile: OutputProfile, docname: str, rewriter: "SplitLinkRewriter", modified: Set[str]
+    ) -> List[str]:
+        """Rewrites the links in a document's files, and returns the split documents that they point into"""
+        parts = profile.link_index.index[docname].parts
+        out_filename = profile.get_out_filename(docname)
+        # The hash of each modified file, for the journal
+        files: Optional[Dict[str, str]] = {} if self.output_records is not None else None
+        targets: Set[str] = set()
+        for name in parts or [os.path.basename(out_filename)]:
+            path = os.path.join(os.path.dirname(out_filename), name)
+            text = read_output_file(path)
+            if text is None:
+                continue
+            new_text, edits, split_targets = rewriter.rewrite(docname, text)
+            targets.update(split_targets)
+            if not edits:
+                continue
+            modified.add(docname)
+            self._write_output(path, new_text, files)
+            if not parts and self.config.markdown_offset_index:
+                self._shift_offset_index(f"{path}.offsets.json", text, edits, files)
+
+        if files:
+            self.output_records.update_files(docname, files)
+        return sorted(targets)
+
+    def _shift_offset_index(
+        self, path: str, text: str, edits: List[Tuple[int, str, str]], files: Optional[Dict[str, str]]
+    ):
+        """Updates the offset index of a file whose links were rewritten"""
+        from sphinx_markdown_builder.sections import get_byte_offsets, shift_offset_index
+
+        offsets = read_output_file(path)
+        if offsets is None:
+            return
+        byte_offsets = get_byte_offsets(text, (start for start, _, _ in edits))
+        changes = [
+            (byte_offsets[start], len(new.encode("utf-8")) - len(old.encode("utf-8"))) for start, old, new in edits
+        ]
+        offset_index = shift_offset_index(json.loads(offsets), changes)
+        self._write_output(path, json.dumps(offset_index, ensure_ascii=False), files)
+
+    def write_doc_serialized(self, docname: str, doctree: nodes.document):
+        # Called in the main process, so parallel workers will not receive the subtrees that are never rendered
+        prune_elements(doctree, self.skipped_elements)
+        if self.config.markdown_copy_assets:
+            self._rewrite_asset_uris(docname, doctree)
+
+    def _rewrite_asset_uris(self, docname: str, doctree: nodes.document):
+        """Points the images and the downloadable files to their copies, relative to the document"""
+        self.post_process_images(doctree)
+        doc_dir = posixpath.dirname(docname)
+        for node in doctree.findall(nodes.image):
+            if node["uri"] in self.env.images:
+                image_name = self.env.images[node["uri"]][1]
+                node["uri"] = posixpath.relpath(f"{IMAGES_DIR}/{image_name}", doc_dir or ".")
+        for node in doctree.findall(addnodes.download_reference):
+            if "filename" in node:
+                node["reftarget"] = posixpath.relpath(f"{DOWNLOADS_DIR}/{node['filename']}", doc_dir or ".")
+
+    def _get_assets(self) -> List["Asset"]:
+        from sphinx_markdown_builder.assets import Asset
+
+        return [
+            Asset(os.path.join(self.srcdir, src), f"{target_dir}/{name}")
+            for target_dir, files in ((IMAGES_DIR, self.env.images), (DOWNLOADS_DIR, self.env.dlfiles))
+            for src, (_, name) in files.items()
+        ]
+
+    def _copy_assets(self):
+        from sphinx_markdown_builder.assets import copy_assets
+
+        assets = self._get_assets()
+        if self.archive is None:
+            stats = copy_assets(assets, [profile.outdir for profile in self.profiles])
+            logger.info(
+                __("copied %d assets, linked %d identical ones, and skipped %d up to date"),
+                stats.copied,
+                stats.linked,
+                stats.skipped,
+            )
+            return
+
+        archive_mtime = get_mod_time_if_exists(self.archive_path, log_error=False) or 0
+        for profile in self.profiles:
+            for asset in assets:
+                name = self._get_member_name(os.path.join(profile.outdir, *asset.target.split("/")))
+                with io_handler(asset.source):
+                    if name not in self.archive_members or os.path.getmtime(asset.source) > archive_mtime:
+                        with open(asset.source, "rb") as file:
+                            self.archive.add(name, file.read())
+
+    def _write_shard_manifest(self):
+        """Lists the documents of this shard, for `sphinx-markdown-merge`"""
+        from sphinx_markdown_builder.shards import MANIFEST_NAME, make_manifest
+
+        file_suffixes = list({profile.file_suffix for profile in self.profiles})
+        manifest = make_manifest(self.shard, list(self.env.found_docs), file_suffixes, self.config.markdown_journal)
+        write_output_file(os.path.join(self.outdir, MANIFEST_NAME), json.dumps(manifest, indent=1))
+
+    def _render(
+        self,
+        docname: str,
+        doctree: nodes.document,
+        setup: Optional["TranslatorSetup"],
+        deadline: Optional[float] = None,
+    ) -> "MarkdownWriter":
+        from sphinx_markdown_builder.writer import MarkdownWriter
+
+        writer = MarkdownWriter(self, docname, setup, deadline)
         destination = StringOutput(encoding="utf-8")
-        self.writer.write(doctree, destination)
-        out_filename = os.path.join(self.outdir, f"{os_path(docname)}{self.out_suffix}")
-        ensuredir(os.path.dirname(out_filename))
+        writer.write(doctree, destination)
+        return writer
+
+    def render_doc(self, docname: str, doctree: nodes.document, setup: Optional["TranslatorSetup"] = None) -> str:
+        """
+        Translates a resolved doctree to markdown. Safe to call concurrently.
+        The translator does not modify the doctree, so it can be rendered with each profile's setup.
+        """
+        return self._render(docname, doctree, setup).output
+
+    def _write_output(self, out_filename: str, output: str, files: Optional[Dict[str, str]] = None):
+        """Writes an output file, and adds its hash to the document's files (if given)"""
+        from sphinx_markdown_builder.journal import hash_content
+
+        if files is not None:
+            files[self._get_member_name(out_filename)] = hash_content(output)
+        if self.archive is None:
+            # The directories were created by `prepare_writing()`
+            write_output_file(out_filename, output, make_dirs=False)
+        else:
+            self.archive.add(self._get_member_name(out_filename), output.encode("utf-8"))
+
+    def _write_split_doc(
+        self, docname: str, writer: "MarkdownWriter", profile: OutputProfile, files: Optional[Dict[str, str]]
+    ) -> List["SplitFile"]:
+        """
+        Writes a document that is larger than `markdown_split_size` as an index file, and files of its sections.
+        Returns the files of the document, if it was split.
+        """
+        from sphinx_markdown_builder.sections import make_split_index, split_document
+
+        max_size = self.config.markdown_split_size
+        if len(writer.output.encode("utf-8")) <= max_size:
+            return []
+
+        parts = writer.visitor.astext_sections()
+        base_name = os.path.basename(os_path(docname))
+        split_files = split_document(parts, base_name, profile.file_suffix, max_size)
+        if len(split_files) <= 1:
+            # A single section that is larger than the limit
+            return []
+
+        out_filename = profile.get_out_filename(docname)
+        for split_file in split_files:
+            self._write_output(os.path.join(os.path.dirname(out_filename), split_file.name), split_file.text, files)
+
+        title = next((section.title for section, _ in parts if section is not None and section.title), docname)
+        # Written last, as the document's modification time is the index file's
+        self._write_output(out_filename, make_split_index(title, split_files), files)
+        return split_files
+
+    @staticmethod
+    def _make_plain_doctree(docname: str, doctree: nodes.document, budget: str, element: str) -> nodes.document:
+        logger.warning(
+            __("%s exceeded the %s budget (at a %s element), and is rendered as plain text"), docname, budget, element
+        )
+        return make_plain_doctree(doctree)
+
+    def _apply_size_budget(self, docname: str, doctree: nodes.document) -> nodes.document:
+        """Returns the doctree, or its plain text version if it has more elements than `markdown_doc_size_limit`"""
+        limit = self.config.markdown_doc_size_limit
+        if limit <= 0:
+            return doctree
+        size, largest = measure_doctree(doctree)
+        if size <= limit:
+            return doctree
+        return self._make_plain_doctree(docname, doctree, "size", largest)
+
+    def _render_within_budget(
+        self, docname: str, doctree: nodes.document, setup: Optional["TranslatorSetup"]
+    ) -> "MarkdownWriter":
+        """Renders the doctree, or its plain text version if it takes longer than `markdown_doc_time_limit`"""
+        from sphinx_markdown_builder.translator import RenderTimeExceeded
+
+        limit = self.config.markdown_doc_time_limit
+        if limit <= 0:
+            return self._render(docname, doctree, setup)
+        try:
+            return self._render(docname, doctree, setup, time.monotonic() + limit)
+        except RenderTimeExceeded as err:
+            plain_doctree = self._make_plain_doctree(docname, doctree, "time", err.node.__class__.__name__)
+            return self._render(docname, plain_doctree, setup)
+
+    def _write_doc(self, docname: str, doctree: nodes.document):
+        from sphinx_markdown_builder.sections import make_offset_index
+
+        doctree = self._apply_size_budget(docname, doctree)
+        # The hash of each output file of the document, only for the journal
+        files: Optional[Dict[str, str]] = {} if self.output_records is not None else None
+        # The doctree is read, resolved and pruned once for all the profiles
+        for profile in self.profiles:
+            writer = self._render_within_budget(docname, doctree, profile.setup)
+            split_files = []
+            if self.config.markdown_split_size > 0:
+                split_files = self._write_split_doc(docname, writer, profile, files)
+            if not split_files:
+                out_filename = profile.get_out_filename(docname)
+                self._write_output(out_filename, writer.output, files)
+                if self.config.markdown_offset_index:
+                    offset_index = make_offset_index(writer.output, writer.visitor.get_mark_offsets())
+                    offsets = json.dumps(offset_index, ensure_ascii=False)
+                    self._write_output(f"{out_filename}.offsets.json", offsets, files)
+
+            if profile.section_records is not None:
+                profile.section_records.add(docname, writer.visitor.astext_sections())
+            if profile.link_index is not None:
+                profile.link_index.add(docname, writer.visitor, split_files)
+        if files is not None:
+            self.output_records.add(docname, files)
+
+    def write_doc(self, docname: str, doctree: nodes.document):
+        if self.threaded_writer is None:
+            self._write_doc(docname, doctree)
+        else:
+            self.threaded_writer.add(docname, doctree)
+
+    def finish(self):
+        if self.threaded_writer is not None:
+            self.threaded_writer.join()
+            self.threaded_writer = None
+
+        self._close_records()
+        if self.output_records is not None:
+            deleted = self._finish_output_records()
+        else:
+            deleted = self._find_removed_outputs()
+        self._delete_outputs(deleted)
+
+        if self.config.markdown_copy_assets:
+            self._copy_assets()
+
+        if self.shard is not None:
+            self._write_shard_manifest()
 
-        with io_handler(out_filename):
-            with open(out_filename, "w", encoding="utf-8") as file:
-                file.write(self.writer.output)
+        if self.archive is not None:
+            self.archive.close(deleted=set(deleted))
+            self.archive = None
@@ -7,7 +7,7 @@ import sys
 import textwrap
 import typing
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, Generic, Iterator, List, Optional, Type, TypeVar, Union
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Type, TypeVar, Union
 
 from tabulate import tabulate
 
@@ -31,6 +31,8 @@ SPACE_CHARS = re.compile(r"\s+")
 LETTERS = re.compile(r"[a-z0-9]", re.I)
 WRAP_REGEXP = re.compile(r"(\s*)(?=\S)([\s\S]+?)(?<=\S)(\s*)", re.M)
 MULTI_LINE_BREAK = re.compile(r"(?<=\n)\n")
+BLANK_LINES = re.compile(r"\n[ \t]*\n(?:[ \t]*\n)+")
+CODE_BLOCK = re.compile(r"^[ \t]*(`{3,}|~{3,}).*?^[ \t]*\1[ \t]*$", re.M | re.S)
 
 
 def is_content_start(value: str) -> bool:
@@ -53,7 +55,24 @@ def replace_multi_line_break(value: str):
     return MULTI_LINE_BREAK.sub("<br/>\n", value)
 
 
-@dataclass
+def collapse_blank_lines(value: str) -> str:
+    """Replaces each run of blank lines with a single blank line, except in code blocks"""
+    parts = []
+    start = 0
+    for match in CODE_BLOCK.finditer(value):
+        end = match.start()
+        parts.append(BLANK_LINES.sub(EOL * 2, value[start:end]))
+        parts.append(match.group())
+        start = match.end()
+    parts.append(BLANK_LINES.sub(EOL * 2, value[start:]))
+    return "".join(parts)
+
+
+# Slotted dataclasses are only supported from Python 3.10
+DATACLASS_SLOTS: Dict[str, bool] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**DATACLASS_SLOTS)
 class SubContextParams:
     prefix_eol: int = 0
     suffix_eol: int = 0
@@ -61,6 +80,8 @@ class SubContextParams:
 
 
 class ListMarker:
+    __slots__ = ("_marker",)
+
     def __init__(self, marker: Union[str, int]):
         self._marker = marker
 
@@ -74,7 +95,7 @@ class ListMarker:
         return self._marker
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class ContextStatus:
     escape_text: bool = True  # Whether to escape characters
     section_level: int = 0  # Current section heading level
@@ -84,6 +105,8 @@ class ContextStatus:
 
 
 class SubContext:
+    __slots__ = ("params", "body", "ensure_eol_count")
+
     def __init__(self, params=SubContextParams()):
         self.params: SubContextParams = params
         self.body: List[str] = []
@@ -157,6 +180,8 @@ class SubContext:
 
 
 class WrappedContext(SubContext):
+    __slots__ = ("prefix", "suffix", "wrap_empty")
+
     def __init__(
         self,
         prefix,
@@ -189,6 +214,8 @@ class WrappedContext(SubContext):
 
 
 class CommaSeparatedContext(SubContext):
+    __slots__ = ("sep", "parameters", "is_parameter")
+
     def __init__(self, sep: str = ", ", params=SubContextParams()):
         super().__init__(params)
         self.sep = sep
@@ -214,29 +241,107 @@ class CommaSeparatedContext(SubContext):
         return ret + self.sep.join(["".join(item) for item in self.parameters])
 
 
-class TableContext(SubContext):
-    def __init__(self, params=SubContextParams()):
+def get_cells_size(cells: List[str]) -> int:
+    return sum(len(cell.encode("utf-8")) for cell in cells)
+
+
+@dataclass(frozen=True, **DATACLASS_SLOTS)
+class TableLimits:
+    """The size of a table's body, above which it is rendered as HTML or split into several tables (0 is unlimited)"""
+
+    rows: int = 0
+    cells: int = 0
+    size: int = 0  # In bytes
+    format: str = "html"  # Or "split"
+
+    def exceeded(self, rows: int, cells: int, size: int) -> bool:
+        return any(0 < limit < value for limit, value in ((self.rows, rows), (self.cells, cells), (self.size, size)))
+
+    def split(self, rows: List[List[str]]) -> Iterator[List[List[str]]]:
+        """Splits the rows into consecutive chunks within the limits (a row that exceeds them is in its own chunk)"""
+        chunk: List[List[str]] = []
+        cells = size = 0
+        for row in rows:
+            row_size = get_cells_size(row)
+            if chunk and self.exceeded(len(chunk) + 1, cells + len(row), size + row_size):
+                yield chunk
+                chunk = []
+                cells = size = 0
+            chunk.append(row)
+            cells += len(row)
+            size += row_size
+        if chunk:
+            yield chunk
+
+
+HTML_TABLE_END = f"</tbody>{EOL}</table>"
+
+
+def make_html_cell(tag: str, cell: str) -> str:
+    """The content is separated from the tags by blank lines, so markdown viewers render it as markdown"""
+    content = cell.strip()
+    if not content:
+        return f"<{tag}></{tag}>"
+    return f"<{tag}>{EOL * 2}{content}{EOL * 2}</{tag}>"
+
+
+def make_html_rows(rows: Iterable[List[str]], tag: str = "td") -> str:
+    return EOL.join(f"<tr>{''.join(make_html_cell(tag, cell) for cell in row)}</tr>" for row in rows)
+
+
+def make_html_table_head(headers: List[str]) -> str:
+    return EOL.join(["<table>", "<thead>", make_html_rows([headers], "th"), "</thead>", "<tbody>"])
+
+
+def make_html_table(headers: List[str], rows: List[List[str]]) -> str:
+    """Renders a table as HTML, a row per line (the cells are not aligned)"""
+    return EOL.join([make_html_table_head(headers), *([make_html_rows(rows)] if rows else []), HTML_TABLE_END])
+
+
+class TableContext(SubContext):  # pylint: disable=too-many-instance-attributes
+    """
+    Collects a table's cells and renders them once the table is complete.
+
+    Each cell is finalized to a single string as soon as it is exited,
+    so the table only keeps one flat list of cells and the offset of each row's first cell.
+    Content outside the cells (e.g., the table's title) is kept in `body`.
+    Once a table exceeds its limits, its rows are rendered as they are exited, and only the headers are kept.
+    """
+
+    __slots__ = (
+        "cells",
+        "row_offsets",
+        "entry",
+        "is_entry",
+        "is_header",
+        "is_body",
+        "compact",
+        "limits",
+        "rows_size",
+        "parts",
+    )
+
+    def __init__(self, params=SubContextParams(), compact: bool = False, limits: Optional[TableLimits] = None):
         super().__init__(params)
-        self.body: List[List[List[str]]] = []
-        self.headers: List[List[List[str]]] = []
-        self.internal_context = SubContext()
+        self.compact = compact  # Whether to render the table without the columns' padding
+        self.limits = limits  # The limits of a large table, if any
+        self.cells: List[str] = []
+        self.row_offsets: List[int] = []
+        self.entry: List[str] = []
+        # The size of the rows after the headers, if it is limited
+        self.rows_size = 0
+        # The rendered parts of a large table: the HTML rows, or the tables it is split into
+        self.parts: List[str] = []
 
         self.is_entry = False
         self.is_header = False
         self.is_body = False
 
-    @property
-    def active_output(self) -> List[List[List[str]]]:
-        if self.is_header:
-            return self.headers
-        assert self.is_body
-        return self.body
-
     @property
     def content(self):
         if self.is_entry:
-            return self.active_output[-1][-1]
-        return self.internal_context.content
+            return self.entry
+        return self.body
 
     def enter_head(self):
         assert not self.is_header and not self.is_body
@@ -255,39 +360,113 @@ class TableContext(SubContext):
         self.is_body = False
 
     def enter_row(self):
-        self.active_output.append([])
+        assert self.is_header or self.is_body
+        self.row_offsets.append(len(self.cells))
 
     def exit_row(self):
-        pass
+        limits = self.limits
+        if limits is None or len(self.row_offsets) < 2:
+            return
+        row_start = self.row_offsets[-1]
+        if limits.size:
+            self.rows_size += get_cells_size(self.cells[row_start:])
+        rows = len(self.row_offsets) - 1
+        exceeded = limits.exceeded(rows, len(self.cells) - self.row_offsets[1], self.rows_size)
+        if limits.format == "html" and (exceeded or self.parts):
+            self.flush_rows(rows)
+        elif limits.format == "split" and exceeded and rows > 1:
+            # The last row starts the next table (same as `TableLimits.split()`)
+            self.flush_rows(rows - 1)
+
+    def flush_rows(self, count: int):
+        """Renders the first rows after the headers, and drops their cells"""
+        rows = self.iter_rows()
+        headers = next(rows)
+        flushed = [next(rows) for _ in range(count)]
+        kept = list(rows)
+        if self.limits.format == "html":
+            if not self.parts:
+                self.parts.append(make_html_table_head(headers))
+            self.parts.append(make_html_rows(flushed))
+        else:
+            self.parts.append(self.make_pipe_table(headers, flushed))
+
+        self.cells = list(headers)
+        self.row_offsets = [0]
+        for row in kept:
+            self.row_offsets.append(len(self.cells))
+            self.cells.extend(row)
+        self.rows_size = sum(map(get_cells_size, kept)) if self.limits.size else 0
 
     def enter_entry(self):
         self.is_entry = True
-        self.active_output[-1].append([])
+        self.entry = []
         self.ensure_eol_count = 0
 
     def exit_entry(self):
         assert self.is_entry
         self.is_entry = False
+        self.cells.append(self.make_cell(self.entry))
+        self.entry = []
 
     @staticmethod
-    def make_row(row):
-        return ["".join(entries).replace("\n", "<br/>") for entries in row]
+    def make_cell(entry: List[str]) -> str:
+        return "".join(entry).replace("\n", "<br/>")
+
+    def iter_rows(self) -> Iterator[List[str]]:
+        ends = [*self.row_offsets[1:], len(self.cells)]
+        for start, end in zip(self.row_offsets, ends):
+            yield self.cells[start:end]
 
     def make(self):
         ctx = SubContext()
-        prefix = self.internal_context.make()
+        prefix = "".join(self.body)
         if prefix:
             ctx.add(prefix)
 
-        content = [*self.headers, *self.body]
-        if len(content) > 0:
-            headers = self.make_row(content[0])
-            body = list(map(self.make_row, content[1:]))
-            ctx.add(tabulate(body, headers=headers, tablefmt="github"), prefix_eol=2)
+        rows = self.iter_rows()
+        headers = next(rows, None)
+        if headers is not None:
+            if self.parts:
+                table = self.make_large_table(headers, list(rows))
+            else:
+                table = self.make_table(headers, list(rows))
+            ctx.add(table, prefix_eol=2)
         return ctx.make()
 
+    def make_large_table(self, headers: List[str], rows: List[List[str]]) -> str:
+        """Adds the rows that were not rendered yet to the parts of a large table"""
+        if self.limits.format == "html":
+            return EOL.join([*self.parts, *([make_html_rows(rows)] if rows else []), HTML_TABLE_END])
+        return (EOL * 2).join([*self.parts, *([self.make_pipe_table(headers, rows)] if rows else [])])
+
+    def make_table(self, headers: List[str], rows: List[List[str]]) -> str:
+        limits = self.limits
+        if limits is None:
+            return self.make_pipe_table(headers, rows)
+        # The size is only measured if it is limited
+        size = sum(map(get_cells_size, rows)) if limits.size else 0
+        if not limits.exceeded(len(rows), sum(map(len, rows)), size):
+            return self.make_pipe_table(headers, rows)
+        if limits.format == "html":
+            return make_html_table(headers, rows)
+        # Each part repeats the headers
+        return (EOL * 2).join(self.make_pipe_table(headers, chunk) for chunk in limits.split(rows))
+
+    def make_pipe_table(self, headers: List[str], rows: List[List[str]]) -> str:
+        if self.compact:
+            return self.make_compact_table(headers, rows)
+        return tabulate(rows, headers=headers, tablefmt="github")
+
+    @staticmethod
+    def make_compact_table(headers: List[str], rows: Iterable[List[str]]) -> str:
+        lines = [headers, ["---"] * len(headers), *rows]
+        return EOL.join(f"|{'|'.join(cell.strip() for cell in cells)}|" for cells in lines)
+
 
 class IndentContext(SubContext):
+    __slots__ = ("support_multi_line_break", "empty", "prefix", "first_prefix")
+
     def __init__(
         self,
         prefix,
@@ -318,6 +497,8 @@ class IndentContext(SubContext):
 
 
 class NoLineBreakContext(SubContext):
+    __slots__ = ("breaker",)
+
     def __init__(self, breaker=" ", params=SubContextParams()):
         super().__init__(params)
         self.breaker = breaker
@@ -327,6 +508,8 @@ class NoLineBreakContext(SubContext):
 
 
 class TitleContext(NoLineBreakContext):
+    __slots__ = ("level",)
+
     def __init__(self, level: int, params=SubContextParams(2, 2)):
         super().__init__("<br/>", params)
         self.level = level
@@ -342,6 +525,8 @@ class TitleContext(NoLineBreakContext):
 
 
 class MetaContext(NoLineBreakContext):
+    __slots__ = ("name",)
+
     def __init__(self, name: str, params=SubContextParams(1, 1, target="head")):
         super().__init__("<br/>", params)
         assert name, "Empty meta name"
@@ -355,6 +540,8 @@ class MetaContext(NoLineBreakContext):
 
 
 class FootNoteContext(NoLineBreakContext):
+    __slots__ = ("ids", "names", "label_body", "is_label")
+
     def __init__(self, ids, names, params=SubContextParams(1, 1)):
         super().__init__(" ", params)
         self.ids = ids
@@ -387,6 +574,8 @@ default_translator: Translator = lambda _node, _elem: {}
 
 
 class PushContext(Generic[_ContextT]):  # pylint: disable=too-few-public-methods
+    __slots__ = ("ctx", "translator", "args", "kwargs")
+
     def __init__(
         self,
         ctx: Type[_ContextT],
@@ -0,0 +1,232 @@
+"""
+Keeps a Sphinx application with the markdown builder resident, and rebuilds the changed documents on each change.
+
+The source tree is polled for changes, and the rendered markdown and the status of the builds are served over HTTP.
+Uses the same layout as `sphinx-build -M markdown`, so it shares the output and the doctrees with regular builds.
+"""
+
+import argparse
+import json
+import os
+import posixpath
+import sys
+import threading
+import time
+import traceback
+from dataclasses import asdict, dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+from sphinx.application import Sphinx
+
+from sphinx_markdown_builder.rst2md import add_overrides_argument, parse_overrides
+
+STATUS_PATH = "/_status"
+# Directories that change without changing the sources
+SKIPPED_DIR_NAMES = ("__pycache__",)
+
+FileState = Tuple[float, int]  # The modification time and the size of a file
+
+
+def scan_tree(root: str, skipped_dirs: Set[str]) -> Dict[str, FileState]:
+    """Returns the state of each file in the tree, except in hidden and skipped directories"""
+    files = {}
+    dirs = [root]
+    while dirs:
+        dir_path = dirs.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or entry.name in SKIPPED_DIR_NAMES:
+                        continue
+                    if entry.is_dir():
+                        if os.path.abspath(entry.path) not in skipped_dirs:
+                            dirs.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            # Removed while scanning
+            continue
+    return files
+
+
+@dataclass
+class BuildStatus:
+    state: str = "starting"  # "building", "succeeded" or "failed"
+    builds: int = 0
+    started: Optional[float] = None
+    duration: Optional[float] = None
+    written: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class MarkdownDaemon:  # pylint: disable=too-many-instance-attributes
+    """
+    Rebuilds the documents that changed since the previous build, with the same Sphinx application.
+    The application is created again if the configuration file changed, or if a build raised an error.
+    """
+
+    def __init__(
+        self,
+        srcdir: str,
+        builddir: str,
+        confoverrides: Optional[Dict[str, Any]] = None,
+        interval: float = 0.5,
+        quiet: bool = False,
+    ):
+        self.srcdir = os.path.abspath(srcdir)
+        self.outdir = os.path.abspath(os.path.join(builddir, "markdown"))
+        self.doctreedir = os.path.abspath(os.path.join(builddir, "doctrees"))
+        self.conf_path = os.path.join(self.srcdir, "conf.py")
+        self.confoverrides = dict(confoverrides or {})
+        self.interval = interval
+        self.quiet = quiet
+
+        self.app: Optional[Sphinx] = None
+        self.status = BuildStatus()
+        # Held while building, so the files are not served while they are written
+        self.lock = threading.Lock()
+        self._files: Dict[str, FileState] = {}
+        self._stopped = threading.Event()
+
+    def _make_app(self) -> Sphinx:
+        app = Sphinx(
+            self.srcdir,
+            self.srcdir,
+            self.outdir,
+            self.doctreedir,
+            "markdown",
+            confoverrides=dict(self.confoverrides),
+            status=None if self.quiet else sys.stdout,
+            warning=sys.stderr,
+            freshenv=False,
+        )
+        # Resolved in the main process, also in parallel builds
+        app.connect("doctree-resolved", lambda _app, _doctree, docname: self.status.written.append(docname))
+        return app
+
+    def rebuild(self, reload_config: bool = False):
+        with self.lock:
+            status = BuildStatus("building", self.status.builds + 1, time.time())
+            self.status = status
+            try:
+                if self.app is None or reload_config:
+                    self.app = self._make_app()
+                self.app.build()
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Keep watching, as the next change may fix it
+                self.app = None
+                status.state = "failed"
+                status.error = traceback.format_exc()
+            else:
+                status.state = "succeeded" if self.app.statuscode == 0 else "failed"
+            status.duration = time.time() - status.started
+
+    def poll(self) -> bool:
+        """Rebuilds if any file in the source tree changed since the previous poll. Returns whether it rebuilt."""
+        files = scan_tree(self.srcdir, {self.outdir, self.doctreedir})
+        changed = {path for path in files.keys() | self._files.keys() if files.get(path) != self._files.get(path)}
+        self._files = files
+        if not changed:
+            return False
+
+        self.rebuild(reload_config=self.conf_path in changed)
+        return True
+
+    def watch(self):
+        """Polls the source tree until `stop()` is called"""
+        while not self._stopped.is_set():
+            self.poll()
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+    def read_output(self, url_path: str) -> Optional[bytes]:
+        """Returns the content of an output file by its URL path, or None if there is no such file"""
+        name = posixpath.normpath(unquote(url_path).lstrip("/"))
+        if name == "." and self.app is not None:
+            name = f"{self.app.config.root_doc}{self.app.config.markdown_file_suffix}"
+        if name.startswith("..") or posixpath.isabs(name):
+            return None
+
+        with self.lock:
+            try:
+                with open(os.path.join(self.outdir, *name.split("/")), "rb") as file:
+                    return file.read()
+            except OSError:
+                return None
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        """Serves the output files and the build status (as JSON, on `/_status`) in a background thread"""
+        server = ThreadingHTTPServer((host, port), make_request_handler(self))
+        threading.Thread(target=server.serve_forever, name="markdown-daemon-http", daemon=True).start()
+        return server
+
+
+def make_request_handler(daemon: MarkdownDaemon):
+    class RequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            path = urlsplit(self.path).path
+            if path == STATUS_PATH:
+                self._respond(json.dumps(asdict(daemon.status)).encode("utf-8"), "application/json")
+                return
+
+            data = daemon.read_output(path)
+            if data is None:
+                self.send_error(HTTPStatus.NOT_FOUND)
+            else:
+                self._respond(data, "text/markdown; charset=utf-8")
+
+        def _respond(self, data: bytes, content_type: str):
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            """The requests are not logged"""
+
+    return RequestHandler
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="sphinx-markdown-daemon",
+        description="Rebuild the markdown files on each change of the sources, and serve them over HTTP.",
+    )
+    parser.add_argument("sourcedir", help="the directory of the sources and conf.py")
+    parser.add_argument("builddir", help="same as `sphinx-build -M markdown` (output in BUILDDIR/markdown)")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to serve on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8000, help="the port to serve on (default: %(default)s)")
+    parser.add_argument(
+        "--interval", type=float, default=0.5, help="seconds between polls of the sources (default: %(default)s)"
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="only output the warnings and the errors")
+    add_overrides_argument(parser)
+    args = parser.parse_args(argv)
+    args.overrides = parse_overrides(parser, args.overrides, sphinx_values=True)
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    daemon = MarkdownDaemon(args.sourcedir, args.builddir, args.overrides, args.interval, args.quiet)
+    server = daemon.serve(args.host, args.port)
+    print(f"Serving the markdown files on http://{args.host}:{server.server_port}/")
+    try:
+        daemon.watch()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
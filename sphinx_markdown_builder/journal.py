@@ -0,0 +1,67 @@
+"""
+Records the output files of each written document with the hash of their content.
+
+The records of the previous build tell which files were created, modified or left untouched by the build,
+and which files are not written anymore (e.g., of documents that were removed), which are deleted.
+The records are only kept for the journal (see `markdown_journal`). Without them, the output files of the documents
+that were removed since the previous build are found by their names.
+"""
+
+import hashlib
+import re
+from typing import Any, Callable, Dict, List, Pattern
+
+from sphinx_markdown_builder.sections import RecordsWriter
+
+JOURNAL_KINDS = ("created", "modified", "deleted", "unchanged")
+
+
+def make_output_pattern(base_name: str, file_suffix: str) -> Pattern[str]:
+    """Matches the names of a document's output files: its file, its offset index, and its split files"""
+    return re.compile(rf"{re.escape(base_name)}(\.\d+)?{re.escape(file_suffix)}(\.offsets\.json)?")
+
+
+def hash_content(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class OutputRecordsWriter(RecordsWriter):
+    """The records of the documents that are not written again are kept, same as the section records"""
+
+    def __init__(self, path: str, keep: Callable[[str], bool]):
+        # The files and hashes of the previous build, of the documents that are written again (or were removed)
+        self.previous: Dict[str, str] = {}
+        # The files and hashes of the documents that are not written again
+        self.kept: Dict[str, str] = {}
+        super().__init__(path, keep)
+
+    def _on_previous_record(self, record: Dict[str, Any], kept: bool):
+        (self.kept if kept else self.previous).update(record["files"])
+
+    def add(self, docname: str, files: Dict[str, str]):
+        self.add_records([{"docname": docname, "files": files}])
+
+    def update_files(self, docname: str, files: Dict[str, str]):
+        """Updates the hashes of a document's files that were modified after they were recorded"""
+        for name in files.keys() & self.kept.keys():
+            # Modified by this build
+            self.previous[name] = self.kept.pop(name)
+        self.update_records({docname}, lambda record: {**record, "files": {**record["files"], **files}})
+
+    def get_files(self) -> Dict[str, str]:
+        """Returns the hash of each output file, once the records are merged"""
+        return {name: digest for record in self.read() for name, digest in record["files"].items()}
+
+
+def make_journal(previous: Dict[str, str], kept: Dict[str, str], files: Dict[str, str]) -> Dict[str, Any]:
+    """Compares the output files of the build with those of the previous build"""
+    journal: Dict[str, List[str]] = {kind: [] for kind in JOURNAL_KINDS}
+    for name, digest in sorted(files.items()):
+        if name in kept or previous.get(name) == digest:
+            journal["unchanged"].append(name)
+        elif name in previous:
+            journal["modified"].append(name)
+        else:
+            journal["created"].append(name)
+    journal["deleted"] = sorted(previous.keys() - files.keys())
+    return {**journal, "hashes": dict(sorted(files.items()))}
@@ -0,0 +1,182 @@
+"""
+An index of the anchors that each written document has, and of its links within the project.
+
+The links are checked once all the documents are written, against the anchors that were actually added
+(e.g., a section's anchor is only added with `markdown_anchor_sections`), and the anchors that markdown viewers
+generate for the headings.
+
+The index also has the files of the split documents (see `markdown_split_size`), with their anchors.
+Once all the documents are written, the links to the anchors of a split document are rewritten
+to point into the file of their anchor.
+"""
+
+import dataclasses
+import posixpath
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import unquote
+
+from sphinx_markdown_builder.sections import RecordsWriter, SplitFile
+from sphinx_markdown_builder.translator import MarkdownTranslator
+
+# The characters that are removed from a heading's text, to make its anchor
+HEADING_SLUG_REMOVED_CHARS = re.compile(r"[^\w\- ]")
+# The links the translator renders to an anchor in another file, as `[text](path#anchor)`
+FILE_LINK_PATTERN = re.compile(r"\]\(([^)#\s]+)#([^)\s]+)\)")
+
+
+def make_heading_slug(title: str) -> str:
+    """Returns the anchor that markdown viewers (e.g., GitHub) generate for a heading"""
+    return HEADING_SLUG_REMOVED_CHARS.sub("", title.strip().lower()).replace(" ", "-")
+
+
+@dataclasses.dataclass(frozen=True)
+class DocLinks:
+    anchors: Set[str]
+    links: List[str]  # As resolved in the doctree: relative to the document, with the builder's document suffix
+    parts: Dict[str, List[str]] = dataclasses.field(default_factory=dict)  # The files of a split document's anchors
+    # The split documents whose files the document's links were rewritten to point into
+    rewritten: List[str] = dataclasses.field(default_factory=list)
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "DocLinks":
+        return cls(set(record["anchors"]), record["links"], record.get("parts", {}), record.get("rewritten", []))
+
+
+class LinkIndexWriter(RecordsWriter):
+    """Keeps the index records of the documents that are not written again, same as the section records"""
+
+    def __init__(self, path: str, keep: Callable[[str], bool]):
+        super().__init__(path, keep)
+        self.index: Dict[str, DocLinks] = {}
+
+    def add(self, docname: str, translator: MarkdownTranslator, split_files: Sequence[SplitFile] = ()):
+        slugs = {make_heading_slug(mark.name) for mark in translator.marks if mark.kind == "title"}
+        record = {"docname": docname, "anchors": sorted(translator.anchors | slugs), "links": translator.links}
+        if split_files:
+            record["parts"] = {split_file.name: split_file.anchors for split_file in split_files}
+        self.add_records([record])
+
+    def close(self):
+        super().close()
+        self.index = {record["docname"]: DocLinks.from_record(record) for record in self.read()}
+
+    def set_rewritten(self, rewritten: Dict[str, List[str]]):
+        """Records the split documents that the links of each document point into, once the index is closed"""
+
+        def update(record: Dict[str, Any]) -> Dict[str, Any]:
+            return {**record, "rewritten": rewritten[record["docname"]]}
+
+        self.update_records(set(rewritten), update)
+        for docname, targets in rewritten.items():
+            self.index[docname] = dataclasses.replace(self.index[docname], rewritten=targets)
+
+
+def resolve_link(docname: str, link: str, doc_suffix: str) -> Optional[Tuple[str, str]]:
+    """Returns the document and the anchor of a link, or None if it is not a link to a document (e.g., to a file)"""
+    path, _, anchor = link.partition("#")
+    if not path:
+        return docname, unquote(anchor)
+    if "://" in path or path.startswith("mailto:") or not path.endswith(doc_suffix):
+        return None
+    end = len(path) - len(doc_suffix)
+    return posixpath.normpath(posixpath.join(posixpath.dirname(docname), unquote(path[:end]))), unquote(anchor)
+
+
+def find_broken_links(index: Dict[str, DocLinks], docnames: Set[str], doc_suffix: str) -> List[Tuple[str, str]]:
+    """
+    Returns the document and the link of each link to a missing anchor, in one pass over the index.
+    Links to pages that the markdown builder does not write (e.g., `genindex`) are not checked,
+    nor the anchors of the documents that are not in the index (e.g., of another shard).
+    """
+    broken = []
+    for docname, doc_links in sorted(index.items()):
+        for link in doc_links.links:
+            resolved = resolve_link(docname, link, doc_suffix)
+            if resolved is None:
+                continue
+            target, anchor = resolved
+            if anchor and target in docnames and target in index and anchor not in index[target].anchors:
+                broken.append((docname, link))
+    return broken
+
+
+def get_anchor_files(index: Dict[str, DocLinks]) -> Dict[str, Dict[str, str]]:
+    """Maps each anchor of the split documents to its file (the first one that has it)"""
+    anchor_files: Dict[str, Dict[str, str]] = {}
+    for docname, doc_links in index.items():
+        if doc_links.parts:
+            files = anchor_files[docname] = {}
+            for name, anchors in doc_links.parts.items():
+                for anchor in anchors:
+                    files.setdefault(anchor, name)
+    return anchor_files
+
+
+def get_split_link_docs(
+    index: Dict[str, DocLinks], anchor_files: Dict[str, Dict[str, str]], doc_suffix: str
+) -> List[str]:
+    """Returns the documents that link to an anchor of a split document, or whose links were rewritten before"""
+    docnames = []
+    for docname, doc_links in sorted(index.items()):
+        resolved = (resolve_link(docname, link, doc_suffix) for link in doc_links.links)
+        if doc_links.rewritten or any(link and link[1] and link[0] in anchor_files for link in resolved):
+            docnames.append(docname)
+    return docnames
+
+
+@dataclasses.dataclass
+class SplitLinkRewriter:
+    """
+    Points the links to the anchors of the split documents into the file of their anchor,
+    and the links into the files of documents that are not split anymore back to the document's file.
+    """
+
+    docnames: Set[str]
+    anchor_files: Dict[str, Dict[str, str]]
+    file_suffix: str  # The suffix of the files the links point to
+
+    def _get_link_target(self, docname: str, path: str) -> Optional[str]:
+        """Returns the document whose file (or one of its split files) the path leads to"""
+        if "://" in path or not path.endswith(self.file_suffix):
+            return None
+        end = len(path) - len(self.file_suffix)
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(docname), path[:end]))
+        if target in self.docnames:
+            return target
+        base, dot, number = target.rpartition(".")
+        return base if dot and number.isdigit() and base in self.docnames else None
+
+    def _rewrite_link(self, docname: str, match: "re.Match[str]") -> Tuple[str, Optional[str]]:
+        """Returns the link to the file of its anchor, and the split document it points into (if any)"""
+        path, anchor = match.groups()
+        target = self._get_link_target(docname, path)
+        if target is None:
+            return match.group(0), None
+        name = self.anchor_files.get(target, {}).get(anchor)
+        split_target = target if name is not None else None
+        if name is None:
+            name = f"{posixpath.basename(target)}{self.file_suffix}"
+        directory, slash, _ = path.rpartition("/")
+        return f"]({directory}{slash}{name}#{anchor})", split_target
+
+    def rewrite(self, docname: str, text: str) -> Tuple[str, List[Tuple[int, str, str]], Set[str]]:
+        """
+        Returns the rewritten text, each replaced link (as its offset in the text, and its old and new text),
+        and the split documents that the links point into.
+        """
+        edits = []
+        split_targets = set()
+        chunks = []
+        last = 0
+        for match in FILE_LINK_PATTERN.finditer(text):
+            link, split_target = self._rewrite_link(docname, match)
+            if split_target is not None:
+                split_targets.add(split_target)
+            if link != match.group(0):
+                start = match.start()
+                edits.append((start, match.group(0), link))
+                chunks.extend([text[last:start], link])
+                last = match.end()
+        chunks.append(text[last:])
+        return "".join(chunks), edits, split_targets
@@ -0,0 +1,147 @@
+"""
+Collects the references of each document, to find the anchors that are referenced in the project.
+
+The markdown builder collects the references while the documents are read (only in the compact mode),
+and from the pickled doctrees of the documents that were read without them (e.g., by an HTML build).
+They are kept in the environment (per document, with its read time), so incremental builds know the references
+of the documents that were not read again. Cross-references and toctrees are resolved when writing,
+so their targets are matched with the domains' objects and the documents' table of contents to find their anchors.
+"""
+
+import dataclasses
+import re
+import time
+from typing import Dict, FrozenSet, Iterable, Iterator, Set, Tuple
+from urllib.parse import unquote
+
+from docutils import nodes
+from sphinx import addnodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+
+ENV_ATTR = "markdown_references"
+# The separators of the names of nested objects (e.g., `module.Class.method` or `ns::Class`)
+NAME_SEPARATORS = re.compile(r"\.|::")
+
+
+@dataclasses.dataclass(frozen=True)
+class DocReferences:
+    ids: FrozenSet[str]  # The IDs that are referenced directly
+    targets: FrozenSet[str]  # The targets of the cross-references
+    toc_docnames: FrozenSet[str]  # The documents whose sections are listed by a toctree
+
+
+def get_doc_references(doctree: nodes.document) -> DocReferences:
+    ids = set()
+    for node in doctree.findall(nodes.reference):
+        refuri = node.get("refuri", "")
+        if "refid" in node:
+            ids.add(node["refid"])
+        elif "://" not in refuri and "#" in refuri:
+            ids.add(unquote(refuri.partition("#")[2]))
+    targets = {node["reftarget"] for node in doctree.findall(addnodes.pending_xref) if node.get("reftarget")}
+    toc_docnames = {
+        docname
+        for toctree in doctree.findall(addnodes.toctree)
+        if toctree.get("maxdepth", -1) != 1 and not toctree.get("titlesonly")
+        for _title, docname in toctree.get("entries", [])
+    }
+    return DocReferences(frozenset(ids), frozenset(targets), frozenset(toc_docnames))
+
+
+# The read time of each document and its references.
+# The references are stamped with the time they were collected until the document's read time is set by Sphinx
+# (after the document is read), which never matches the read time, so they are collected again if it is not set.
+DocReferencesEntry = Tuple[int, DocReferences]
+
+
+def _get_references(env: BuildEnvironment) -> Dict[str, DocReferencesEntry]:
+    if not hasattr(env, ENV_ATTR):
+        setattr(env, ENV_ATTR, {})
+    return getattr(env, ENV_ATTR)
+
+
+def on_doctree_read(app: Sphinx, doctree: nodes.document):
+    _get_references(app.env)[app.env.docname] = (time.time_ns() // 1_000, get_doc_references(doctree))
+
+
+def on_env_purge_doc(_app: Sphinx, env: BuildEnvironment, docname: str):
+    _get_references(env).pop(docname, None)
+
+
+def on_env_merge_info(_app: Sphinx, env: BuildEnvironment, docnames: Set[str], other: BuildEnvironment):
+    """Merges the references that were collected by a parallel reader process"""
+    other_references = _get_references(other)
+    _get_references(env).update((docname, other_references[docname]) for docname in docnames)
+
+
+def set_read_times(env: BuildEnvironment, docnames: Iterable[str]):
+    """Stamps the references of the documents that were read (before the environment is pickled)"""
+    references = _get_references(env)
+    for docname in docnames:
+        if docname in references and docname in env.all_docs:
+            references[docname] = (env.all_docs[docname], references[docname][1])
+
+
+def update_references(env: BuildEnvironment):
+    """
+    Collects the references of the documents that were read without collecting them, or read again since,
+    from their pickled doctrees. Drops the references of the documents that were removed.
+    """
+    references = _get_references(env)
+    for docname in references.keys() - env.all_docs.keys():
+        del references[docname]
+    for docname, read_time in env.all_docs.items():
+        collected_time = references[docname][0] if docname in references else None
+        if collected_time != read_time:
+            references[docname] = (read_time, get_doc_references(env.get_doctree(docname)))
+
+
+def _iter_name_suffixes(name: str) -> Iterator[str]:
+    """Yields the name, and each of its suffixes that starts after a separator (as relative targets refer to it)"""
+    yield name
+    for match in NAME_SEPARATORS.finditer(name):
+        start = match.end()
+        yield name[start:]
+
+
+def _get_object_ids(env: BuildEnvironment, targets: Set[str]) -> Iterator[str]:
+    """
+    Yields the anchors of the domains' objects that the targets may refer to.
+    A target may match several objects (e.g., a method's name in several classes), and all of them are kept.
+    """
+    domains = env.domains.sorted() if hasattr(env.domains, "sorted") else env.domains.values()
+    for domain in domains:
+        for name, _dispname, _type, _docname, anchor, _priority in domain.get_objects():
+            if anchor and any(suffix.lower() in targets for suffix in _iter_name_suffixes(name)):
+                yield anchor
+
+
+def _get_toc_ids(env: BuildEnvironment, docnames: Set[str]) -> Iterator[str]:
+    """Yields the anchors in the table of contents of the documents, and of the documents they include"""
+    pending = list(docnames)
+    visited = set()
+    while pending:
+        docname = pending.pop()
+        if docname in visited or docname not in env.tocs:
+            continue
+        visited.add(docname)
+        pending.extend(env.toctree_includes.get(docname, ()))
+        for reference in env.tocs[docname].findall(nodes.reference):
+            anchor = reference.get("anchorname", "")
+            if anchor.startswith("#"):
+                yield anchor[1:]
+
+
+def get_referenced_ids(env: BuildEnvironment) -> FrozenSet[str]:
+    """Returns the IDs that may be referenced by any document of the project, so no link is broken without them"""
+    ids = set()
+    targets = set()
+    toc_docnames = set()
+    for _read_time, references in _get_references(env).values():
+        ids.update(references.ids)
+        targets.update(target.lstrip("~.").lower() for target in references.targets)
+        toc_docnames.update(references.toc_docnames)
+    ids.update(_get_object_ids(env, targets))
+    ids.update(_get_toc_ids(env, toc_docnames))
+    return frozenset(ids)
@@ -0,0 +1,135 @@
+"""
+Renders doctrees and reStructuredText strings to markdown in memory, without writing any file.
+
+Uses the markdown builder of a Sphinx application, so Sphinx's directives, roles and cross-references are supported.
+"""
+
+import copy
+import io
+import posixpath
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import rst
+from sphinx.util.docutils import sphinx_domains
+
+try:
+    # Sphinx 9+ reads the sources without a docutils publisher (see `Builder.read_doc()`)
+    from sphinx.util.docutils import _parse_str_to_doctree
+except ImportError:  # pragma: no cover
+    _parse_str_to_doctree = None  # pylint: disable=invalid-name
+
+from sphinx_markdown_builder.builder import MarkdownBuilder
+from sphinx_markdown_builder.translator import TranslatorSetup
+
+# The parsed sources are read as this document, in the directory of the document they are rendered as
+SCRATCH_DOCNAME = "_markdown_render"
+
+
+@contextmanager
+def restoring_document_state(env: BuildEnvironment):
+    """Restores the environment's state of the current document (`temp_data` before Sphinx 8), after parsing"""
+    name = "current_document" if hasattr(env, "current_document") else "temp_data"
+    state = getattr(env, name)
+    setattr(env, name, copy.copy(state))
+    try:
+        yield
+    finally:
+        setattr(env, name, state)
+
+
+@contextmanager
+def isolating_document(app: Sphinx, docname: str):
+    """
+    Removes a scratch document from the environment after parsing it, and restores the domains' data
+    (e.g., the labels of the project's documents that the scratch document defines again)
+    """
+    env = app.env
+    domaindata = copy.deepcopy(env.domaindata)
+    try:
+        yield
+    finally:
+        app.events.emit("env-purge-doc", env, docname)
+        env.clear_doc(docname)
+        for name, data in domaindata.items():
+            # In place, as the domains keep their data
+            env.domaindata[name].clear()
+            env.domaindata[name].update(data)
+
+
+def read_rst(app: Sphinx, source: str, docname: str) -> nodes.document:
+    """
+    Parses reStructuredText the same as Sphinx reads a source of the project: with the environment's settings,
+    the registered parser and transforms, and the `source-read` event.
+    The document's labels, objects and titles are added to the environment (see `isolating_document()`).
+    """
+    env = app.env
+    env.prepare_settings(docname)
+    filename = env.doc2path(docname)
+    if _parse_str_to_doctree is not None:
+        parser = app.registry.create_source_parser("restructuredtext", config=app.config, env=env)
+        return _parse_str_to_doctree(
+            source,
+            filename=filename,
+            default_role=app.config.default_role,
+            default_settings=env.settings,
+            env=env,
+            events=app.events,
+            parser=parser,
+            transforms=app.registry.get_transforms(),
+        )
+
+    # Before Sphinx 9, the sources are read by the publisher of `sphinx.io`
+    from sphinx.io import create_publisher  # pylint: disable=import-outside-toplevel,no-name-in-module
+
+    publisher = create_publisher(app, "restructuredtext")
+    env.temp_data["_parser"] = publisher.parser
+    with sphinx_domains(env), rst.default_role(docname, app.config.default_role):
+        publisher.set_source(source=io.StringIO(source), source_path=str(filename))
+        publisher.publish()
+    return publisher.document
+
+
+class MarkdownRenderer:
+    """
+    Renders to markdown with a prepared markdown builder, which is shared by all the calls.
+    Safe to call from multiple threads: the sources are parsed and resolved one at a time (as they use
+    the application's environment), and are translated concurrently.
+    """
+
+    def __init__(self, app: Sphinx, setup: Optional[TranslatorSetup] = None):
+        self.app = app
+        if isinstance(app.builder, MarkdownBuilder):
+            self.builder = app.builder
+        else:
+            # E.g., to render the doctrees that are resolved by the HTML builder
+            # (without the markdown build's event handlers)
+            self.builder = app.create_builder(MarkdownBuilder.name)
+            self.builder.init_translation()
+        self.builder.prepare_translator()
+        self.setup = setup
+        self._env_lock = threading.Lock()
+
+    def render_doctree(self, doctree: nodes.document, docname: str = "index") -> str:
+        """Renders a resolved doctree (which is not modified)"""
+        return self.builder.render_doc(docname, doctree, self.setup)
+
+    def parse_rst(self, source: str, docname: str = "index") -> nodes.document:
+        """
+        Parses reStructuredText as a document of the project, and resolves its references.
+        The references are resolved by the application's builder, relative to the directory of the document.
+        The environment is left unchanged.
+        """
+        scratch = posixpath.join(posixpath.dirname(docname), SCRATCH_DOCNAME)
+        with self._env_lock, isolating_document(self.app, scratch):
+            with restoring_document_state(self.app.env):
+                doctree = read_rst(self.app, source, scratch)
+            self.app.env.resolve_references(doctree, scratch, self.app.builder)
+        return doctree
+
+    def render_rst(self, source: str, docname: str = "index") -> str:
+        return self.render_doctree(self.parse_rst(source, docname), docname)
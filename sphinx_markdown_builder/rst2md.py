@@ -0,0 +1,233 @@
+"""
+Standalone conversion of docutils-only reStructuredText to markdown.
+
+Uses the same writer and translator as the markdown builder, but without a Sphinx application.
+Sphinx's directives and roles (e.g., autodoc, toctree, or cross-references) are not supported.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from docutils import nodes
+from docutils.core import publish_string
+
+from sphinx_markdown_builder import CONFIG_VALUES
+from sphinx_markdown_builder.translator import MarkdownTranslator, TranslatorSetup
+from sphinx_markdown_builder.writer import MarkdownWriter
+
+CONFIG_TYPES = {name: types for name, _default, _rebuild, types in CONFIG_VALUES}
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off", "")
+
+# Same as Sphinx, the document title is kept as a section title
+DOCUTILS_SETTINGS = {"output_encoding": "unicode", "doctitle_xform": False, "sectsubtitle_xform": False}
+
+
+def make_config(overrides: Optional[Dict[str, Any]] = None) -> SimpleNamespace:
+    """Creates a minimal stand-in for Sphinx's configuration with the markdown configuration values"""
+    config = {name: default for name, default, _rebuild, _types in CONFIG_VALUES}
+    if overrides:
+        unknown = set(overrides) - set(config)
+        if unknown:
+            raise ValueError(f"Unknown configuration values: {', '.join(sorted(unknown))}")
+        config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+def parse_config_value(name: str, value: str) -> Any:
+    """
+    Parses a `name=value` command line override according to the type of the configuration value
+    (lists and dicts are parsed as JSON). Raises ValueError for an invalid value.
+    """
+    types = CONFIG_TYPES.get(name, str)
+    if types is bool:
+        if value.lower() not in TRUE_VALUES + FALSE_VALUES:
+            raise ValueError(f"expected a boolean ({', '.join(TRUE_VALUES)} or {', '.join(FALSE_VALUES[:-1])})")
+        return value.lower() in TRUE_VALUES
+    if types in (list, dict):
+        parsed = json.loads(value)
+        if not isinstance(parsed, types):
+            raise ValueError(f"expected a JSON {'array' if types is list else 'object'}")
+        return parsed
+    return types(value)
+
+
+class StandaloneTranslator(MarkdownTranslator):
+    def visit_system_message(self, _node):
+        """Docutils already reported the message (Sphinx removes these nodes before writing)"""
+        raise nodes.SkipNode
+
+
+class StandaloneBuilder:
+    """The subset of `MarkdownBuilder` that the writer and the translator use"""
+
+    name = "markdown"
+    format = "markdown"
+
+    def __init__(self, config: SimpleNamespace):
+        self.config = config
+        # Sphinx's translator looks up the domains, which are not available without an environment
+        self.env = SimpleNamespace(domains=None)
+        self.translator_setup = TranslatorSetup.from_config(config)
+
+    def get_target_uri(self, docname: str, _typ: str = None):
+        return f"{docname}{self.config.markdown_uri_doc_suffix}"
+
+    def create_translator(self, *args) -> MarkdownTranslator:
+        return StandaloneTranslator(*args)
+
+
+class Converter:
+    """Converts reStructuredText to markdown. The configuration work is done once, and shared by all conversions."""
+
+    def __init__(self, config_overrides: Optional[Dict[str, Any]] = None):
+        self.builder = StandaloneBuilder(make_config(config_overrides))
+
+    def convert(self, source: str, source_path: Optional[str] = None, doc_name: str = "index") -> str:
+        writer = MarkdownWriter(self.builder, doc_name)
+        return publish_string(source, source_path=source_path, writer=writer, settings_overrides=DOCUTILS_SETTINGS)
+
+    def get_output_path(
+        self, source_path: str, output_dir: Optional[str] = None, source_root: Optional[str] = None
+    ) -> str:
+        """
+        Returns the path of a file's markdown file: next to it, or in `output_dir`.
+        In `output_dir`, the file is at its path relative to `source_root` (by default, the file's directory).
+        """
+        base, _ = os.path.splitext(source_path)
+        if output_dir is not None:
+            source_root = source_root or os.path.dirname(os.path.abspath(source_path))
+            base = os.path.join(output_dir, os.path.relpath(os.path.abspath(base), source_root))
+        return f"{base}{self.builder.config.markdown_file_suffix}"
+
+    def convert_file(
+        self, source_path: str, output_dir: Optional[str] = None, source_root: Optional[str] = None
+    ) -> str:
+        """Converts a file, and returns the path of the markdown file"""
+        with open(source_path, encoding="utf-8") as file:
+            source = file.read()
+        doc_name = os.path.splitext(os.path.basename(source_path))[0]
+        output = self.convert(source, source_path, doc_name)
+
+        output_path = self.get_output_path(source_path, output_dir, source_root)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as file:
+            file.write(output)
+        return output_path
+
+
+def rst_to_markdown(source: str, config_overrides: Optional[Dict[str, Any]] = None, doc_name: str = "index") -> str:
+    """Converts a reStructuredText string to markdown"""
+    return Converter(config_overrides).convert(source, doc_name=doc_name)
+
+
+# The converter of each process in the pool
+_worker_converter: Optional[Converter] = None  # pylint: disable=invalid-name
+
+
+def _init_worker(config_overrides: Optional[Dict[str, Any]]):
+    global _worker_converter  # pylint: disable=global-statement
+    _worker_converter = Converter(config_overrides)
+
+
+def _convert_file_in_worker(source_path: str, output_dir: Optional[str], source_root: Optional[str]) -> str:
+    assert _worker_converter is not None
+    return _worker_converter.convert_file(source_path, output_dir, source_root)
+
+
+def get_source_root(source_paths: List[str]) -> Optional[str]:
+    """Returns the common directory of the files, so their markdown files keep their relative paths"""
+    if not source_paths:
+        return None
+    return os.path.commonpath([os.path.dirname(os.path.abspath(source_path)) for source_path in source_paths])
+
+
+def convert_files(
+    source_paths: Iterable[str],
+    output_dir: Optional[str] = None,
+    config_overrides: Optional[Dict[str, Any]] = None,
+    jobs: int = 1,
+) -> List[str]:
+    """
+    Converts reStructuredText files to markdown files in a single process, or in a process pool if `jobs` > 1.
+    The markdown files are written next to the source files, unless `output_dir` is given.
+    In `output_dir`, they keep their paths relative to the common directory of the source files
+    (e.g., `docs/README.rst` and `src/README.rst` are converted to `docs/README.md` and `src/README.md`).
+    Returns the paths of the markdown files.
+    """
+    source_paths = list(source_paths)
+    source_root = get_source_root(source_paths)
+    if jobs <= 1 or len(source_paths) <= 1:
+        converter = Converter(config_overrides)
+        return [converter.convert_file(source_path, output_dir, source_root) for source_path in source_paths]
+
+    count = len(source_paths)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(config_overrides,)) as executor:
+        return list(executor.map(_convert_file_in_worker, source_paths, [output_dir] * count, [source_root] * count))
+
+
+def add_overrides_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "-D",
+        dest="overrides",
+        action="append",
+        default=[],
+        metavar="name=value",
+        help="override a configuration value (e.g., markdown_flavor=github), with lists and dicts as JSON",
+    )
+
+
+def parse_overrides(
+    parser: argparse.ArgumentParser, overrides: List[str], sphinx_values: bool = False
+) -> Dict[str, Any]:
+    """
+    Parses the `-D name=value` overrides, and reports an invalid one as a usage error.
+    With `sphinx_values`, the other configuration values are kept as strings, which Sphinx converts.
+    """
+    values = {}
+    for override in overrides:
+        name, sep, value = override.partition("=")
+        if not sep or not name:
+            parser.error(f"invalid -D value {override!r}, expected name=value")
+        if name not in CONFIG_TYPES and not sphinx_values:
+            parser.error(f"unknown configuration value {name!r}")
+        try:
+            values[name] = parse_config_value(name, value)
+        except ValueError as err:
+            parser.error(f"invalid -D value {override!r}: {err}")
+    return values
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="rst2md",
+        description="Convert docutils reStructuredText files to markdown, without a Sphinx project.",
+    )
+    parser.add_argument("sources", nargs="+", metavar="SOURCE", help="reStructuredText files ('-' for stdin)")
+    parser.add_argument("-o", "--output-dir", help="write the markdown files to this directory")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="convert the files in a pool of processes")
+    add_overrides_argument(parser)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    overrides = parse_overrides(parser, args.overrides)
+
+    if args.sources == ["-"]:
+        sys.stdout.write(rst_to_markdown(sys.stdin.read(), overrides))
+        return 0
+
+    for output_path in convert_files(args.sources, args.output_dir, overrides, args.jobs):
+        print(output_path)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
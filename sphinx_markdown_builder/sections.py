@@ -0,0 +1,271 @@
+"""
+Section-based outputs of the rendered documents.
+"""
+
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sphinx.util.osutil import ensuredir
+
+from sphinx_markdown_builder.builder import io_handler
+from sphinx_markdown_builder.contexts import DATACLASS_SLOTS, SubContext
+from sphinx_markdown_builder.escape import escape_html_quote, escape_markdown_chars
+from sphinx_markdown_builder.translator import OutputMark, SectionMark
+
+# The anchors the translator emits (e.g., by `_add_anchor()`, and for footnotes)
+ANCHOR_PATTERN = re.compile(r"""<a id=(["'])(.+?)\1>""")
+# The translator renders the references within the document as `[text](#anchor)`
+LOCAL_LINK_PATTERN = re.compile(r"\]\(#([^)\s]+)\)")
+
+Part = Tuple[Optional[SectionMark], str]
+# Joins the parts of a split file
+PART_SEPARATOR = "\n"
+
+
+@dataclass(**DATACLASS_SLOTS)
+class SplitFile:
+    name: str  # The file's name, in the directory of the document
+    text: str
+    sections: List[SectionMark]
+    anchors: List[str]
+
+
+def pack_parts(sizes: List[int], max_size: int, separator_size: int = 0) -> List[List[int]]:
+    """
+    Groups consecutive parts, such that each group's total size (with the separators between its parts)
+    is at most `max_size`. A part that is larger than `max_size` is kept whole, in its own group.
+    """
+    groups: List[List[int]] = []
+    total = 0
+    for i, size in enumerate(sizes):
+        if not groups or total + separator_size + size > max_size:
+            groups.append([])
+            total = -separator_size
+        groups[-1].append(i)
+        total += separator_size + size
+    return groups
+
+
+def _get_anchors(sections: List[SectionMark], text: str) -> List[str]:
+    anchors = [anchor for section in sections for anchor in section.ids]
+    anchors.extend(match.group(2) for match in ANCHOR_PATTERN.finditer(text))
+    return list(dict.fromkeys(anchors))
+
+
+def _get_part_size(part: Part, link_growth: int) -> int:
+    """The part's size after its links to the anchors of other parts are rewritten to point into another file"""
+    section, text = part
+    anchors = set(_get_anchors([section] if section is not None else [], text))
+    links = sum(1 for match in LOCAL_LINK_PATTERN.finditer(text) if match.group(1) not in anchors)
+    return len(text.encode("utf-8")) + links * link_growth
+
+
+def _make_split_file(name: str, parts: List[Part]) -> SplitFile:
+    text = PART_SEPARATOR.join(text for _, text in parts)
+    sections = [section for section, _ in parts if section is not None]
+    return SplitFile(name, text, sections, _get_anchors(sections, text))
+
+
+def split_document(parts: List[Part], base_name: str, file_suffix: str, max_size: int) -> List[SplitFile]:
+    """
+    Packs a document's sections into files of at most `max_size` bytes (unless a single section is larger).
+    The references within the document are rewritten to point into the file of their anchor.
+    """
+    # At most, a rewritten link has the longest file name before its anchor
+    link_growth = len(f"{base_name}.{len(parts)}{file_suffix}".encode("utf-8"))
+    sizes = [_get_part_size(part, link_growth) for part in parts]
+    files = [
+        _make_split_file(f"{base_name}.{n}{file_suffix}", [parts[i] for i in group])
+        for n, group in enumerate(pack_parts(sizes, max_size, len(PART_SEPARATOR)), start=1)
+    ]
+
+    anchor_files = {}
+    for split_file in files:
+        for anchor in split_file.anchors:
+            anchor_files.setdefault(anchor, split_file.name)
+
+    for split_file in files:
+
+        def replace_link(match, name=split_file.name):
+            anchor = match.group(1)
+            target = anchor_files.get(anchor, name)
+            return match.group(0) if target == name else f"]({target}#{anchor})"
+
+        split_file.text = LOCAL_LINK_PATTERN.sub(replace_link, split_file.text)
+    return files
+
+
+def make_split_index(title: str, files: List[SplitFile]) -> str:
+    """
+    Lists the files of a split document.
+    Each item has the anchors of its file, so references to `document#anchor` lead to the right file.
+    """
+    ctx = SubContext()
+    ctx.add(f"# {escape_markdown_chars(title)}", suffix_eol=2)
+    for split_file in files:
+        anchors = "".join(f'<a id="{escape_html_quote(anchor)}"></a>' for anchor in split_file.anchors)
+        label = split_file.sections[0].title if split_file.sections else split_file.name
+        ctx.add(f"* {anchors}[{escape_markdown_chars(label)}]({split_file.name})", suffix_eol=1)
+    ctx.force_eol(1)
+    return ctx.make()
+
+
+def get_byte_offsets(text: str, offsets: Iterable[int]) -> Dict[int, int]:
+    """Maps character offsets in the text to byte offsets in its UTF-8 encoding, by encoding it once"""
+    if text.isascii():
+        return {offset: offset for offset in offsets}
+
+    byte_offsets = {}
+    prev_offset = byte_offset = 0
+    for offset in sorted(set(offsets)):
+        byte_offset += len(text[prev_offset:offset].encode("utf-8"))
+        byte_offsets[offset] = byte_offset
+        prev_offset = offset
+    return byte_offsets
+
+
+def make_offset_index(output: str, mark_offsets: Iterable[Tuple[OutputMark, int, int]]) -> Dict[str, Any]:
+    """
+    Maps the anchors and the titles of a document to their byte offset and length in the document's file.
+    A repeated anchor is mapped to its first occurrence.
+    """
+    mark_offsets = list(mark_offsets)
+    byte_offsets = get_byte_offsets(
+        output, (offset for _, start, length in mark_offsets for offset in (start, start + length))
+    )
+
+    anchors: Dict[str, List[int]] = {}
+    titles: List[List[Any]] = []
+    for mark, start, length in mark_offsets:
+        byte_start = byte_offsets[start]
+        byte_length = byte_offsets[start + length] - byte_start
+        if mark.kind == "anchor":
+            anchors.setdefault(mark.name, [byte_start, byte_length])
+        else:
+            titles.append([mark.name, byte_start, byte_length])
+    return {"anchors": anchors, "titles": titles}
+
+
+def shift_offset_index(offset_index: Dict[str, Any], edits: Iterable[Tuple[int, int]]) -> Dict[str, Any]:
+    """
+    Updates the offsets of an index after the file was edited, given the byte offset and the change in length
+    of each edit. An element that contains an edit (e.g., a list with a link) changes its length.
+    """
+    edits = list(edits)
+
+    def shift(start: int, length: int) -> List[int]:
+        start_change = sum(change for offset, change in edits if offset < start)
+        end_change = sum(change for offset, change in edits if offset < start + length)
+        return [start + start_change, length + end_change - start_change]
+
+    anchors = {anchor: shift(*span) for anchor, span in offset_index["anchors"].items()}
+    titles = [[title, *shift(start, length)] for title, start, length in offset_index["titles"]]
+    return {"anchors": anchors, "titles": titles}
+
+
+def make_section_records(docname: str, parts: List[Part]) -> Iterator[Dict[str, Any]]:
+    """Yields a record for each section of a document (and for its content before the first section, if any)"""
+    titles: List[Tuple[int, str]] = []  # The titles of the current section and its ancestors
+    for section, text in parts:
+        if section is not None:
+            while titles and titles[-1][0] >= section.level:
+                titles.pop()
+            titles.append((section.level, section.title))
+
+        yield {
+            "docname": docname,
+            "ids": section.ids if section is not None else [],
+            "titles": [title for _, title in titles],
+            "level": section.level if section is not None else 0,
+            "body": text,
+            "length": len(text.encode("utf-8")),
+        }
+
+
+class RecordsWriter:
+    """
+    Appends the records of each written document (which have its `docname`) to a JSON Lines file.
+    The worker processes of parallel builds append to their own files, which are merged by `close()`.
+    """
+
+    def __init__(self, path: str, keep: Callable[[str], bool]):
+        self.path = path
+        self._main_pid = os.getpid()
+        self._lock = threading.Lock()
+        ensuredir(os.path.dirname(path))
+        self._keep_records(keep)
+
+    @property
+    def _worker_glob(self) -> str:
+        return f"{glob.escape(self.path)}.*.part"
+
+    def _keep_records(self, keep: Callable[[str], bool]):
+        """Keeps the records of a previous build, of the documents that will not be written again"""
+        for worker_path in glob.glob(self._worker_glob):
+            os.remove(worker_path)
+
+        lines = []
+        with io_handler(self.path, log_error=False):
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    record = json.loads(line)
+                    kept = keep(record["docname"])
+                    self._on_previous_record(record, kept)
+                    if kept:
+                        lines.append(line)
+
+        with io_handler(self.path):
+            with open(self.path, "w", encoding="utf-8") as file:
+                file.writelines(lines)
+
+    def _on_previous_record(self, record: Dict[str, Any], kept: bool):
+        """Called with each record of the previous build, and whether it is kept"""
+
+    def add_records(self, records: Iterable[Dict[str, Any]]):
+        """Safe to call concurrently. The records of each document are appended (and flushed) at once."""
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        pid = os.getpid()
+        path = self.path if pid == self._main_pid else f"{self.path}.{pid}.part"
+        with self._lock, io_handler(path):
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(data)
+
+    def close(self):
+        """Merges the files of the worker processes"""
+        with io_handler(self.path):
+            with open(self.path, "a", encoding="utf-8") as file:
+                for worker_path in sorted(glob.glob(self._worker_glob)):
+                    with open(worker_path, encoding="utf-8") as worker_file:
+                        shutil.copyfileobj(worker_file, file)
+                    os.remove(worker_path)
+
+    def read(self) -> Iterator[Dict[str, Any]]:
+        """Reads the records, once they are merged"""
+        with io_handler(self.path):
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    yield json.loads(line)
+
+    def update_records(self, docnames: Set[str], update: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """Replaces the records of the documents, once the records are merged"""
+        if not docnames:
+            return
+        lines = []
+        for record in self.read():
+            if record["docname"] in docnames:
+                record = update(record)
+            lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        with io_handler(self.path):
+            with open(self.path, "w", encoding="utf-8") as file:
+                file.writelines(lines)
+
+
+class SectionRecordsWriter(RecordsWriter):
+    def add(self, docname: str, parts: List[Part]):
+        self.add_records(make_section_records(docname, parts))
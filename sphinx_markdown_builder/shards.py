@@ -0,0 +1,201 @@
+"""
+Sharded builds: each shard writes the documents assigned to it, and the shards' outputs are merged afterwards.
+
+Every shard reads all the sources (so the cross-references resolve the same), and writes a manifest.
+The merge combines the output trees, and validates the manifests and the links between the documents.
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import re
+import shutil
+import sys
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote
+
+MANIFEST_NAME = "shard-manifest.json"
+# The output files that each shard writes for its own documents, which are concatenated by the merge
+CONCATENATED_SUFFIXES = (".jsonl",)
+# The links the translator renders, as `[text](target)`
+LINK_PATTERN = re.compile(r"\]\(([^)\s]+)\)")
+
+
+def parse_shard(value: str) -> Optional[Tuple[int, int]]:
+    """Parses `i/N` (where `i` is between 1 and N), or returns None for an empty value"""
+    if not value:
+        return None
+
+    index, _, count = value.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise ValueError(f"Invalid shard {value!r}, expected i/N (e.g., 1/4)")
+    return int(index), int(count)
+
+
+def get_doc_shard(docname: str, count: int) -> int:
+    """Assigns the document to a shard by a stable hash of its name, the same on every machine"""
+    return zlib.crc32(docname.encode("utf-8")) % count + 1
+
+
+def make_manifest(
+    shard: Tuple[int, int], all_docnames: List[str], file_suffixes: List[str], journal: str = ""
+) -> Dict[str, Any]:
+    index, count = shard
+    return {
+        "shard": index,
+        "shards": count,
+        "docnames": sorted(docname for docname in all_docnames if get_doc_shard(docname, count) == index),
+        "all_docnames": sorted(all_docnames),
+        "file_suffixes": sorted(file_suffixes),
+        "journal": journal,
+    }
+
+
+def read_manifest(shard_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(shard_dir, MANIFEST_NAME), encoding="utf-8") as file:
+        return json.load(file)
+
+
+def check_manifests(manifests: List[Dict[str, Any]]) -> List[str]:
+    """Checks that the shards are of the same build, and that each document was written by exactly one shard"""
+    problems = []
+    count = manifests[0]["shards"]
+    indexes = sorted(manifest["shard"] for manifest in manifests)
+    if indexes != list(range(1, count + 1)) or any(manifest["shards"] != count for manifest in manifests):
+        problems.append(f"expected shards 1 to {count}, got: {', '.join(map(str, indexes))}")
+
+    all_docnames = manifests[0]["all_docnames"]
+    if any(manifest["all_docnames"] != all_docnames for manifest in manifests):
+        problems.append("the shards were built from different sources")
+
+    written = [docname for manifest in manifests for docname in manifest["docnames"]]
+    if sorted(written) != all_docnames:
+        problems.append(f"{len(written)} documents were written by the shards, out of {len(all_docnames)}")
+    return problems
+
+
+def _list_files(root: str) -> List[str]:
+    """Returns the paths of the files in the tree, relative to its root"""
+    files = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        files.extend(os.path.relpath(os.path.join(dir_path, name), root) for name in sorted(file_names))
+    return files
+
+
+def merge_journals(journals: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merges the journals of the shards, each of which lists the output files of its own documents.
+    A file that was deleted by a shard and written by another one (e.g., of a document that moved) is not deleted.
+    """
+    hashes = dict(sorted(item for journal in journals for item in journal["hashes"].items()))
+    kinds = [kind for kind in journals[0] if kind != "hashes"]
+    merged = {kind: sorted({name for journal in journals for name in journal[kind]}) for kind in kinds}
+    merged["deleted"] = [name for name in merged["deleted"] if name not in hashes]
+    return {**merged, "hashes": hashes}
+
+
+def _read_journal(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def merge_trees(shard_dirs: List[str], outdir: str, journal_name: str = "") -> List[str]:
+    """
+    Copies the files of the shards into the output directory.
+    Files that are written by several shards must be identical, except for the concatenated ones and the journals.
+    """
+    problems = []
+    merged = set()
+    journals = []
+    for shard_dir in shard_dirs:
+        for name in _list_files(shard_dir):
+            source = os.path.join(shard_dir, name)
+            dest = os.path.join(outdir, name)
+            if name == MANIFEST_NAME:
+                continue
+            if journal_name and name == os.path.normpath(journal_name):
+                journals.append(_read_journal(source))
+                continue
+            if name not in merged:
+                merged.add(name)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.copy2(source, dest)
+            elif name.endswith(CONCATENATED_SUFFIXES):
+                with open(source, "rb") as src_file, open(dest, "ab") as dest_file:
+                    shutil.copyfileobj(src_file, dest_file)
+            elif not filecmp.cmp(source, dest, shallow=False):
+                problems.append(f"{name}: differs between the shards")
+    if journals:
+        journal_path = os.path.join(outdir, journal_name)
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        with open(journal_path, "w", encoding="utf-8") as file:
+            json.dump(merge_journals(journals), file, indent=1)
+    return problems
+
+
+def _get_link_docname(name: str, target: str, suffixes: Tuple[str, ...]) -> Optional[str]:
+    """Returns the document of a link from a file, or None if it is not a relative link to a document"""
+    path = unquote(target.partition("#")[0])
+    suffix = next((suffix for suffix in suffixes if path.endswith(suffix)), None)
+    if "://" in target or suffix is None:
+        return None
+    path = os.path.normpath(os.path.join(os.path.dirname(name), path[: -len(suffix)]))
+    return path.replace(os.path.sep, "/")
+
+
+def find_dangling_links(outdir: str, docnames: List[str], file_suffixes: List[str]) -> List[str]:
+    """
+    Returns the links to documents of the project whose file does not exist.
+    Links to pages that the markdown builder does not write (e.g., `genindex`) are not checked.
+    """
+    problems = []
+    docnames = set(docnames)
+    suffixes = tuple(file_suffixes)
+    files = set(_list_files(outdir))
+    for name in sorted(files):
+        if not name.endswith(suffixes):
+            continue
+        with open(os.path.join(outdir, name), encoding="utf-8") as file:
+            targets = LINK_PATTERN.findall(file.read())
+        for target in targets:
+            docname = _get_link_docname(name, target, suffixes)
+            if docname in docnames and not any(os.path.normpath(docname + suffix) in files for suffix in suffixes):
+                problems.append(f"{name}: dangling link to {target}")
+    return problems
+
+
+def merge_shards(shard_dirs: List[str], outdir: str) -> List[str]:
+    """Merges the output directories of the shards. Returns the problems that were found (if any)."""
+    manifests = sorted(
+        ((read_manifest(shard_dir), shard_dir) for shard_dir in shard_dirs), key=lambda item: item[0]["shard"]
+    )
+    problems = check_manifests([manifest for manifest, _ in manifests])
+    first_manifest = manifests[0][0]
+    problems.extend(merge_trees([shard_dir for _, shard_dir in manifests], outdir, first_manifest["journal"]))
+    problems.extend(find_dangling_links(outdir, first_manifest["all_docnames"], first_manifest["file_suffixes"]))
+    return problems
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="sphinx-markdown-merge",
+        description="Merge the output directories of a sharded markdown build (see markdown_shard).",
+    )
+    parser.add_argument("shard_dirs", nargs="+", metavar="SHARD_DIR", help="the output directory of each shard")
+    parser.add_argument("-o", "--output-dir", required=True, help="the merged output directory")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    problems = merge_shards(args.shard_dirs, args.output_dir)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -23,10 +23,15 @@ Base HTML5 translator (example):
 https://github.com/docutils/docutils/blob/master/docutils/docutils/writers/html5_polyglot/__init__.py
 """
 
+# pylint: disable=too-many-lines
+
 import dataclasses
+import itertools
 import posixpath
 import re
-from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union
+import time
+from types import MethodType
+from typing import TYPE_CHECKING, Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple, Type, Union
 
 from docutils import languages, nodes
 from sphinx.util.docutils import SphinxTranslator
@@ -34,6 +39,7 @@ from sphinx.util.docutils import SphinxTranslator
 from sphinx_markdown_builder.contexts import (
     CommaSeparatedContext,
     ContextStatus,
+    DATACLASS_SLOTS,
     DOC_INFO_CONTEXT,
     IndentContext,
     ITALIC_CONTEXT,
@@ -45,10 +51,12 @@ from sphinx_markdown_builder.contexts import (
     SubContextParams,
     SUBSCRIPT_CONTEXT,
     TableContext,
+    TableLimits,
     TitleContext,
     UniqueString,
     WrappedContext,
     FootNoteContext,
+    collapse_blank_lines,
 )
 from sphinx_markdown_builder.escape import escape_html_quote, escape_markdown_chars
 
@@ -58,6 +66,12 @@ if TYPE_CHECKING:  # pragma: no cover
 VISIT_DEPART_PATTERN = re.compile("(visit|depart)_(.+)")
 SKIP = UniqueString("skip")
 
+# The rules of `markdown_node_rules`: skip the element's subtree, render only its children, or render its text
+NODE_RULES = ("skip", "passthrough", "raw")
+# The keys of `markdown_large_tables` and the respective `TableLimits` fields, and the formats of large tables
+TABLE_LIMIT_KEYS = {"rows": "rows", "cells": "cells", "bytes": "size"}
+TABLE_FORMATS = ("html", "split")
+
 DOC_INFO_FIELDS = "author", "contact", "copyright", "date", "organization", "revision", "status", "version"
 
 # Defines context items, skip, or None (keep processing sub-tree).
@@ -112,6 +126,126 @@ PREDEFINED_ELEMENTS: Dict[str, Union[PushContext, SKIP, None]] = dict(  # pylint
 )
 
 
+def get_skipped_elements(translator_class: Type[nodes.NodeVisitor]) -> FrozenSet[str]:
+    """Returns the elements whose subtrees are never rendered, unless the translator class overrides them"""
+    return frozenset(
+        element
+        for element, action in PREDEFINED_ELEMENTS.items()
+        if action is SKIP and not hasattr(translator_class, f"visit_{element}")
+    )
+
+
+def check_node_rules(rules: Dict[str, str]) -> Dict[str, str]:
+    invalid = sorted(element for element, rule in rules.items() if rule not in NODE_RULES)
+    if invalid:
+        expected = ", ".join(NODE_RULES)
+        raise ValueError(f"Invalid markdown_node_rules of {', '.join(invalid)} (expected one of {expected})")
+    return dict(rules)
+
+
+def make_table_limits(value: Dict[str, Any]) -> Optional[TableLimits]:
+    """Parses `markdown_large_tables`, or returns None if it is empty"""
+    if not value:
+        return None
+    unknown = sorted(set(value) - {*TABLE_LIMIT_KEYS, "format"})
+    if unknown:
+        raise ValueError(f"Unknown markdown_large_tables keys: {', '.join(unknown)}")
+    limits = {TABLE_LIMIT_KEYS[key]: limit for key, limit in value.items() if key in TABLE_LIMIT_KEYS}
+    if any(not isinstance(limit, int) or limit < 0 for limit in limits.values()):
+        raise ValueError("The markdown_large_tables limits must be non-negative integers")
+    if value.get("format", "html") not in TABLE_FORMATS:
+        raise ValueError(f"Invalid markdown_large_tables format (expected one of {', '.join(TABLE_FORMATS)})")
+    return TableLimits(**limits, format=value.get("format", "html"))
+
+
+def make_doc_info_from_config(config) -> Tuple[str, ...]:
+    doc_info = []
+    for key in DOC_INFO_FIELDS:
+        value = getattr(config, key, "")
+        if isinstance(value, str):
+            ctx = MetaContext(key)
+            ctx.add(value)
+            doc_info.append(ctx.make())
+    return tuple(doc_info)
+
+
+@dataclasses.dataclass(frozen=True)
+class TranslatorSetup:  # pylint: disable=too-many-instance-attributes
+    """
+    The translator's per-build invariants: a snapshot of the configuration and the work derived from it.
+    The builder creates it once before writing, and it is shared by all the translators.
+    """
+
+    http_base: str = ""
+    anchor_sections: bool = False
+    anchor_signatures: bool = False
+    bullet: str = "*"
+    flavor: str = ""
+    doc_info: Tuple[str, ...] = ()  # Rendered doc info metadata from the configuration
+    # The suffix of the documents' URIs in the resolved doctree, and its replacement (e.g., of an output profile)
+    replace_uri_doc_suffix: Optional[Tuple[str, str]] = None
+    # The rule of each element type (see `NODE_RULES`), which override the translator's handling of the element
+    node_rules: Dict[str, str] = dataclasses.field(default_factory=dict, compare=False)
+    compact: bool = False
+    table_limits: Optional[TableLimits] = None
+    # The IDs that are referenced in the project, whose anchors are kept in the compact output (None keeps all)
+    referenced_ids: Optional[FrozenSet[str]] = dataclasses.field(default=None, compare=False)
+    languages: Dict[str, Any] = dataclasses.field(default_factory=dict, compare=False)
+    # The visit and depart functions of each translator class and element type (see `_get_handlers()`),
+    # which depend on the node rules, so `dataclasses.replace()` starts a new table
+    handlers: Dict[Tuple[type, Type[nodes.Node]], Tuple[Callable, Callable]] = dataclasses.field(
+        default_factory=dict, init=False, compare=False, repr=False
+    )
+
+    @classmethod
+    def from_config(cls, config) -> "TranslatorSetup":
+        return cls(
+            http_base=config.markdown_http_base,
+            anchor_sections=config.markdown_anchor_sections,
+            anchor_signatures=config.markdown_anchor_signatures,
+            bullet=config.markdown_bullet,
+            flavor=config.markdown_flavor,
+            doc_info=make_doc_info_from_config(config) if config.markdown_docinfo else (),
+            node_rules=check_node_rules(config.markdown_node_rules),
+            compact=config.markdown_compact,
+            table_limits=make_table_limits(config.markdown_large_tables),
+        )
+
+    def get_language(self, language_code: str, reporter=None):
+        language = self.languages.get(language_code, None)
+        if language is None:
+            # noinspection PyUnresolvedReferences
+            language = self.languages[language_code] = languages.get_language(language_code, reporter)
+        return language
+
+
+@dataclasses.dataclass(**DATACLASS_SLOTS)
+class SectionMark:
+    """The start of a section in the document's top-level content"""
+
+    index: int  # The index of the section's first value in the top-level content
+    level: int
+    ids: List[str]
+    title: str
+
+
+@dataclasses.dataclass(**DATACLASS_SLOTS)
+class OutputMark:
+    """An anchor or a title, and where it is rendered in the document's top-level content"""
+
+    index: int  # The index of the top-level value that has the mark (or the first one after it)
+    kind: str  # "anchor" or "title"
+    name: str
+
+
+class RenderTimeExceeded(Exception):
+    """Raised when the translation of a document exceeds its deadline"""
+
+    def __init__(self, node: nodes.Node):
+        super().__init__(node.__class__.__name__)
+        self.node = node
+
+
 def _assign_visit_method(method, variable: str):
     match = VISIT_DEPART_PATTERN.fullmatch(method.__name__)
     assert match is not None
@@ -131,12 +265,24 @@ def pushing_status(method):
     return _assign_visit_method(method, "__pushing_status__")
 
 
-class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-methods
-    def __init__(self, document: nodes.document, builder: "MarkdownBuilder"):
+class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-methods,too-many-instance-attributes
+    def __init__(
+        self,
+        document: nodes.document,
+        builder: "MarkdownBuilder",
+        doc_name: Optional[str] = None,
+        setup: Optional[TranslatorSetup] = None,
+    ):
         super().__init__(document, builder)
         self.builder: "MarkdownBuilder" = builder
-        # noinspection PyUnresolvedReferences
-        self.language = languages.get_language(self.settings.language_code, document.reporter)
+        # All the per-document state is kept in the translator, so documents can be translated concurrently
+        self.doc_name = doc_name
+        if setup is None:
+            setup = getattr(builder, "translator_setup", None)
+        if not isinstance(setup, TranslatorSetup):
+            setup = TranslatorSetup.from_config(self.config)
+        self.setup: TranslatorSetup = setup
+        self.language = self.setup.get_language(self.settings.language_code, document.reporter)
         # Warn only once per writer about unsupported elements
         self._warned = set()
 
@@ -144,17 +290,20 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
         self._ctx_queue: List[SubContext] = [SubContext()]
         self._doc_info: SubContext = SubContext()
         self._status_queue: List[ContextStatus] = [ContextStatus()]
+        self.sections: List[SectionMark] = []
+        self.marks: List[OutputMark] = []
+        # The anchors that were added, and the internal links (as resolved in the doctree), e.g., to check the links
+        self.anchors: Set[str] = set()
+        self.links: List[str] = []
+        # The `time.monotonic()` by which the translation must end, if any
+        self.deadline: Optional[float] = None
 
-        if self.config.markdown_docinfo:
-            self._add_doc_info_from_config()
+        self._add_doc_info_from_config()
 
     def _add_doc_info_from_config(self):
-        for key in DOC_INFO_FIELDS:
-            value = getattr(self.config, key, "")
-            if isinstance(value, str):
-                self._push_context(MetaContext(key))
-                self.ctx.add(value)
-                self._pop_context()
+        for meta in self.setup.doc_info:
+            # Same as popping a `MetaContext`
+            self._doc_info.add(meta, prefix_eol=1, suffix_eol=1)
 
     @property
     def ctx(self) -> SubContext:
@@ -192,10 +341,16 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
         self._pop_context(node)
         self._pop_status(node)
 
-    def astext(self):
-        """Return the final formatted document as a string."""
+    def _finish_content(self):
         self._pop_context(count=2**31)
         assert len(self._ctx_queue) == 1
+        if self.setup.compact:
+            content = self._ctx_queue[0].content
+            content[:] = [collapse_blank_lines(value) for value in content]
+
+    def astext(self):
+        """Return the final formatted document as a string."""
+        self._finish_content()
 
         ctx = SubContext()
         for sub_ctx in (self._doc_info, self._ctx_queue[0]):
@@ -203,6 +358,51 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
         ctx.force_eol(1)
         return ctx.make()
 
+    def astext_sections(self) -> List[Tuple[Optional[SectionMark], str]]:
+        """
+        Return the final formatted document split at the start of each section, with the section of each part.
+        The first part is the content before the first section (e.g., the doc info). Empty parts are omitted.
+        """
+        self._finish_content()
+
+        content = self._ctx_queue[0].content
+        bounds = [0, *(section.index for section in self.sections), len(content)]
+        parts = []
+        for section, start, end in zip([None, *self.sections], bounds, bounds[1:]):
+            ctx = SubContext()
+            if section is None:
+                ctx.add(self._doc_info.make().strip(), prefix_eol=2, suffix_eol=1)
+            ctx.add("".join(content[start:end]).strip(), prefix_eol=2, suffix_eol=1)
+            ctx.force_eol(1)
+            text = ctx.make()
+            if text.strip():
+                parts.append((section, text))
+        return parts
+
+    def get_mark_offsets(self) -> Iterator[Tuple[OutputMark, int, int]]:
+        """
+        Yields each mark, with the offset and length (in characters) of its value in the output of `astext()`.
+        A mark inside a nested context (e.g., a list) gets the offset and length of its top-level value.
+        """
+        doc_info = self._doc_info.make().strip()
+        content = self._ctx_queue[0].content
+        text = "".join(content)
+        # The offset of the first value in the output (see `astext()`)
+        offset = (len(doc_info) + 2 if doc_info else 0) - (len(text) - len(text.lstrip()))
+
+        starts = list(itertools.accumulate([offset, *(len(value) for value in content)]))
+        for mark in self.marks:
+            index = mark.index
+            while index < len(content) and not content[index].strip():
+                index += 1
+            if index < len(content):
+                value = content[index]
+                value_start = starts[index] + len(value) - len(value.lstrip())
+                yield mark, value_start, len(value.strip())
+
+    def _mark(self, kind: str, name: str):
+        self.marks.append(OutputMark(len(self._ctx_queue[0].content), kind, name))
+
     def add(self, value: str, prefix_eol: int = 0, suffix_eol: int = 0):
         """See `SubContext.add()`"""
         self.ctx.add(value, prefix_eol, suffix_eol)
@@ -249,7 +449,12 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
             return self._skip
         if isinstance(action, PushContext):
             if state == "visit":
-                return lambda node: self._push_context(action.create(node, element))
+
+                def push_context(translator: "MarkdownTranslator", node):
+                    translator._push_context(action.create(node, element))  # pylint: disable=protected-access
+
+                # Bound like the other handlers, whose functions are shared by the translators (see `_find_handler()`)
+                return MethodType(push_context, self)
             return self._pop_context
         return None
 
@@ -293,6 +498,62 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
 
         return None
 
+    def _check_deadline(self, node):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise RenderTimeExceeded(node)
+
+    def _find_handler(self, state: str, node_class: Type[nodes.Node]) -> Optional[Callable]:
+        """
+        Same as `SphinxTranslator`, the handler of the node's class, or else of its closest base class.
+        Returns the function of the handler, as the ones that extensions register are bound to each translator.
+        """
+        for base in node_class.__mro__:
+            name = f"{state}_{base.__name__}"
+            handler = getattr(self, name, None)
+            if not handler:
+                continue
+            if getattr(handler, "__self__", None) is self:
+                return handler.__func__
+            # E.g., a function that is assigned to the translator, which is looked up on each translator
+            return lambda translator, node, name=name: getattr(translator, name)(node)
+        return None
+
+    def _get_handlers(self, node_class: Type[nodes.Node]) -> Tuple[Callable, Callable]:
+        """
+        Returns the visit and depart functions of an element type, which are resolved once for all the translators
+        of the setup. The rule of the element type (see `markdown_node_rules`) replaces the translator's handlers.
+        """
+        key = (self.__class__, node_class)
+        handlers = self.setup.handlers.get(key)
+        if handlers is None:
+            rule = self.setup.node_rules.get(node_class.__name__)
+            if rule is None:
+                visit = self._find_handler("visit", node_class) or self.unknown_visit.__func__
+                depart = self._find_handler("depart", node_class) or self.unknown_departure.__func__
+                handlers = (visit, depart)
+            else:
+                rule_visits = {"skip": self._skip, "passthrough": self._pass, "raw": self._add_raw_text}
+                handlers = (rule_visits[rule].__func__, self._pass.__func__)
+            self.setup.handlers[key] = handlers
+        return handlers
+
+    def dispatch_visit(self, node):
+        self._check_deadline(node)
+        self._get_handlers(node.__class__)[0](self, node)
+
+    def dispatch_departure(self, node):
+        self._get_handlers(node.__class__)[1](self, node)
+        # Checked once the element is departed too, as departing may do most of its work (e.g., rendering a table)
+        self._check_deadline(node)
+
+    def _add_raw_text(self, node):
+        text = escape_markdown_chars(node.astext())
+        if isinstance(node, nodes.Inline):
+            self.add(text)
+        else:
+            self.add(text, prefix_eol=2, suffix_eol=2)
+        raise nodes.SkipNode
+
     def unknown_visit(self, node):
         """Warn once per instance for unsupported nodes."""
         node_type = node.__class__.__name__
@@ -346,7 +607,7 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
     def visit_Text(self, node):  # pylint: disable=invalid-name
         text = node.astext().replace("\r", "")
         # Replace line breaks with spaces to create single-line paragraphs
-        if self.config.markdown_flavor == "github":
+        if self.setup.flavor == "github":
             text = text.replace("\n", " ")
         if self.status.escape_text:
             text = escape_markdown_chars(text)
@@ -473,14 +734,19 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
     @pushing_status
     def visit_section(self, node):
         self.ensure_eol(2)
-        if self.config.markdown_anchor_sections:
+        if len(self._ctx_queue) == 1:
+            title = node[0].astext() if node.children and isinstance(node[0], nodes.title) else ""
+            mark = SectionMark(len(self.ctx.content), self.status.section_level + 1, node.get("ids", []), title)
+            self.sections.append(mark)
+        if self.setup.anchor_sections:
             for anchor in node.get("ids", []):
                 self._add_anchor(anchor)
 
         self._push_status(section_level=self.status.section_level + 1)
 
     @pushing_context
-    def visit_title(self, _node):
+    def visit_title(self, node):
+        self._mark("title", node.astext())
         if isinstance(self.ctx, TableContext):
             level = 4
         else:
@@ -510,18 +776,28 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
 
     def _adjust_url(self, url: str):
         """Replace `refuri` in reference with HTTP address, if possible"""
-        if not self.config.markdown_http_base:
+        if not self.setup.http_base:
             return url
 
         # If HTTP page build URL known, make link relative to that.
-        this_doc = self.builder.current_doc_name
+        this_doc = self.doc_name
         if url == "":  # Reference to this doc
-            url = self.builder.get_target_uri(this_doc)
+            url = self._replace_uri_doc_suffix(self.builder.get_target_uri(this_doc))
         else:  # URL is relative to the current docname.
             this_dir = posixpath.dirname(this_doc)
             if this_dir:
                 url = posixpath.normpath(f"{this_dir}/{url}")
-        return f"{self.config.markdown_http_base}/{url}"
+        return f"{self.setup.http_base}/{url}"
+
+    def _replace_uri_doc_suffix(self, uri: str) -> str:
+        if self.setup.replace_uri_doc_suffix is None:
+            return uri
+
+        old_suffix, new_suffix = self.setup.replace_uri_doc_suffix
+        path, sep, anchor = uri.partition("#")
+        if not path or not path.endswith(old_suffix):
+            return uri
+        return f"{path[:len(path) - len(old_suffix)]}{new_suffix}{sep}{anchor}"
 
     def _fetch_ref_uri(self, node):
         uri = node.get("refuri", "")
@@ -530,10 +806,11 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
         if not node.get("internal", self.status.default_ref_internal):
             return uri
 
-        uri = self._adjust_url(uri)
+        ref_id = node.get("refid", None)
+        self.links.append(uri if ref_id is None else f"#{ref_id}")
+        uri = self._adjust_url(self._replace_uri_doc_suffix(uri))
 
         # Whatever the URL is, add the anchor to it
-        ref_id = node.get("refid", None)
         if ref_id is not None:
             uri = f"#{ref_id}"
 
@@ -550,9 +827,17 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
         self._push_context(WrappedContext("[", f"]({reftarget})"))
 
     def _add_anchor(self, anchor: str):
+        if self.setup.compact:
+            # Each anchor is added once, and only if it is referenced
+            referenced_ids = self.setup.referenced_ids
+            if anchor in self.anchors or (referenced_ids is not None and anchor not in referenced_ids):
+                return
+
         content = f'<a id="{escape_html_quote(anchor)}"></a>'
         # Prevent adding the same anchor twice in the same context
         if content not in self.ctx.content:
+            self.anchors.add(anchor)
+            self._mark("anchor", anchor)
             self.add(content, prefix_eol=2, suffix_eol=1)
 
     def visit_target(self, node):
@@ -599,7 +884,7 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
     depart_enumerated_list = _end_list
 
     def visit_bullet_list(self, node):
-        self._start_list(node.attributes.get("bullet", self.config.markdown_bullet))
+        self._start_list(node.attributes.get("bullet", self.setup.bullet))
 
     depart_bullet_list = _end_list
     visit_list_item = _start_list_item
@@ -633,7 +918,7 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
         """the main signature of class/method"""
 
         # Insert anchors if enabled by the config
-        if self.config.markdown_anchor_signatures:
+        if self.setup.anchor_signatures:
             for anchor in node.get("ids", []):
                 self._add_anchor(anchor)
 
@@ -711,7 +996,7 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
 
     @pushing_context
     def visit_table(self, _node):
-        self._push_context(TableContext(params=SubContextParams(2, 1)))
+        self._push_context(TableContext(SubContextParams(2, 1), self.setup.compact, self.setup.table_limits))
 
     def visit_thead(self, _node):
         self.table_ctx.enter_head()  # workaround pylint: disable=no-member
@@ -756,6 +1041,7 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
     @pushing_context
     def visit_footnote_reference(self, node):
         ref_id = node.get("refid", "")
+        self.links.append(f"#{ref_id}")
         self._push_context(WrappedContext("<sup>[", f"](#{ref_id})</sup>"))
 
     @pushing_context
@@ -766,6 +1052,8 @@ class MarkdownTranslator(SphinxTranslator):  # pylint: disable=too-many-public-m
         names = node.get("names", "")
         if isinstance(names, (list, tuple)):
             names = ",".join(names)
+        if ids:
+            self.anchors.add(ids)
         self._push_context(FootNoteContext(ids, names, params=SubContextParams(1, 1)))
 
     def visit_label(self, node):
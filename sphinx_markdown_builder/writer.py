@@ -14,6 +14,9 @@ class MarkdownWriter(writers.Writer):
     output = None
     """Final translated form of `document`."""
 
+    visitor = None
+    """The translator of the last document (e.g., to get its sections)."""
+
     # Add configuration settings for additional Markdown flavours here.
     settings_spec = (
         "Markdown writer options",
@@ -42,11 +45,19 @@ class MarkdownWriter(writers.Writer):
 
     translator_class = MarkdownTranslator
 
-    def __init__(self, builder=None):
+    def __init__(self, builder=None, doc_name=None, setup=None, deadline=None):
         super().__init__()
         self.builder = builder
+        self.doc_name = doc_name
+        self.setup = setup
+        self.deadline = deadline
 
     def translate(self):
-        visitor = self.builder.create_translator(self.document, self.builder)
+        args = (self.document, self.builder, self.doc_name)
+        if self.setup is not None:
+            # The translator uses the builder's setup by default
+            args += (self.setup,)
+        self.visitor = visitor = self.builder.create_translator(*args)
+        visitor.deadline = self.deadline
         self.document.walkabout(visitor)
         self.output = visitor.astext()
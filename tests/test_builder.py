@@ -2,14 +2,24 @@
 Integration tests for the markdown builder
 """
 
+import json
 import os
+import pickle
+import re
 import shutil
 import stat
+import tarfile
+import zipfile
 from pathlib import Path
-from typing import Iterable
+from typing import Dict, Iterable, Optional
 
 import pytest
+from sphinx.application import Sphinx
 from sphinx.cmd.build import main
+from sphinx.errors import ConfigError
+
+from sphinx_markdown_builder.journal import hash_content
+from sphinx_markdown_builder.shards import MANIFEST_NAME, merge_shards
 
 BUILD_PATH = "./tests/docs-build"
 SOURCE_PATH = "./tests/source"
@@ -75,6 +85,38 @@ def run_sphinx(build_path, *flags):
     assert ret_code == 0
 
 
+def make_app(build_path, overrides: Optional[Dict] = None, source_path=SOURCE_PATH) -> Sphinx:
+    """Creates a markdown application, with the same directories as `run_sphinx()`"""
+    return Sphinx(
+        str(source_path),
+        str(source_path),
+        os.path.join(build_path, "markdown"),
+        os.path.join(build_path, "doctrees"),
+        "markdown",
+        confoverrides=overrides or {},
+        status=None,
+        warning=None,
+    )
+
+
+def build_app(build_path, overrides: Optional[Dict] = None, source_path=SOURCE_PATH, force_all=False) -> Sphinx:
+    """Builds with an application of `make_app()`, and validate success"""
+    app = make_app(build_path, overrides, source_path)
+    app.build(force_all=force_all)
+    assert app.statuscode == 0
+    return app
+
+
+def _write_sources(tmp_path: Path, sources: Dict[str, str]) -> Path:
+    """Writes a project of the given documents, and returns its source directory"""
+    srcdir = tmp_path / "source"
+    srcdir.mkdir()
+    (srcdir / "conf.py").write_text('extensions = ["sphinx_markdown_builder"]\n', encoding="utf-8")
+    for docname, text in sources.items():
+        (srcdir / f"{docname}.rst").write_text(text, encoding="utf-8")
+    return srcdir
+
+
 @pytest.mark.parametrize(["flags", "build_path"], OPTIONS, ids=TEST_NAMES)
 def test_builder_make_all(flags: Iterable[str], build_path: str):
     run_sphinx(build_path, "-a", *flags)
@@ -130,3 +172,518 @@ def test_custom_file_suffix():
 
     # Clean up
     _rm_build_path(build_path)
+
+
+def _read_outputs(path: str) -> Dict[str, str]:
+    outputs = {}
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            outputs[os.path.relpath(file_path, path)] = Path(file_path).read_text(encoding="utf-8")
+    return outputs
+
+
+def test_write_threads():
+    """Test that the thread-pool write mode generates the same files as the serial mode"""
+    serial_path = os.path.join(BUILD_PATH, "test_serial")
+    threads_path = os.path.join(BUILD_PATH, "test_threads")
+    _rm_build_path(serial_path)
+    _rm_build_path(threads_path)
+
+    run_sphinx(serial_path, "-a")
+    run_sphinx(threads_path, "-a", "-D", "markdown_write_threads=4")
+
+    serial_outputs = _read_outputs(os.path.join(serial_path, "markdown"))
+    assert len(serial_outputs) > 0
+    assert _read_outputs(os.path.join(threads_path, "markdown")) == serial_outputs
+
+    _rm_build_path(serial_path)
+    _rm_build_path(threads_path)
+
+
+def test_reuse_doctrees():
+    """Test that the markdown builder can write the doctrees of an HTML build without reading the sources"""
+    build_path = os.path.join(BUILD_PATH, "test_reuse")
+    _rm_build_path(build_path)
+    assert main(["-M", "html", SOURCE_PATH, build_path, "-q"]) == 0
+    env_pickle = Path(build_path, "doctrees", "environment.pickle")
+    env_mtime = env_pickle.stat().st_mtime
+
+    # The sources are not read again, so the environment is not pickled again
+    run_sphinx(build_path, "-D", "markdown_reuse_doctrees=1")
+    assert env_pickle.stat().st_mtime == env_mtime
+    assert os.path.exists(os.path.join(build_path, "markdown", "index.md"))
+
+    _rm_build_path(build_path)
+
+
+def test_reuse_doctrees_modified(tmp_path):
+    """Test that the sources that were modified since the HTML build are read again"""
+    srcdir = _write_sources(tmp_path, {"index": "Index\n=====\n\nOld text.\n"})
+    build_path = str(tmp_path / "build")
+    assert main(["-M", "html", str(srcdir), build_path, "-q"]) == 0
+
+    with open(srcdir / "index.rst", "a", encoding="utf-8") as file:
+        file.write("\nNew text.\n")
+    os.utime(srcdir / "index.rst", (0, os.path.getmtime(srcdir / "index.rst") + 10))
+    build_app(build_path, {"markdown_reuse_doctrees": True}, srcdir)
+    assert "New text." in (tmp_path / "build" / "markdown" / "index.md").read_text(encoding="utf-8")
+
+
+def test_markdown_alongside_html():
+    """Test that the HTML builder writes the markdown files when configured"""
+    build_path = os.path.join(BUILD_PATH, "test_alongside")
+    _rm_build_path(build_path)
+    flags = ["-a", "-q", "-D", "markdown_html_outdir=../markdown", "-D", "markdown_anchor_sections=1"]
+    assert main(["-M", "html", SOURCE_PATH, build_path, *flags]) == 0
+
+    assert os.path.exists(os.path.join(build_path, "html", "index.html"))
+    index = Path(build_path, "markdown", "index.md").read_text(encoding="utf-8")
+    assert '<a id="' in index
+    assert "ExampleRSTFile.html" in index
+    assert os.path.exists(os.path.join(build_path, "markdown", "library", "my_module.md"))
+
+    _rm_build_path(build_path)
+
+
+def test_output_profiles():
+    """Test that each output profile generates the same files as a build with the profile's configuration"""
+    build_path = os.path.join(BUILD_PATH, "test_profiles")
+    default_path = os.path.join(BUILD_PATH, "test_profiles_default")
+    github_path = os.path.join(BUILD_PATH, "test_profiles_github")
+    for path in (build_path, default_path, github_path):
+        _rm_build_path(path)
+
+    github_config = {"flavor": "github", "bullet": "-", "uri_doc_suffix": ".html", "file_suffix": ".html.md"}
+    build_app(build_path, {"markdown_profiles": [{}, {"outdir": "github", **github_config}]}, force_all=True)
+
+    run_sphinx(default_path, "-a")
+    run_sphinx(github_path, "-a", *(f"-Dmarkdown_{key}={value}" for key, value in github_config.items()))
+
+    outputs = _read_outputs(os.path.join(build_path, "markdown"))
+    github_outputs = _read_outputs(os.path.join(github_path, "markdown"))
+    assert len(github_outputs) > 0
+    for name, output in github_outputs.items():
+        assert outputs.pop(os.path.join("github", name)) == output
+    assert outputs == _read_outputs(os.path.join(default_path, "markdown"))
+
+    for path in (build_path, default_path, github_path):
+        _rm_build_path(path)
+
+
+def test_split_size():
+    """Test that the documents larger than the size limit are split at section boundaries"""
+    build_path = os.path.join(BUILD_PATH, "test_split")
+    _rm_build_path(build_path)
+    run_sphinx(build_path, "-a", "-D", "markdown_split_size=4000")
+
+    markdown_dir = os.path.join(build_path, "markdown")
+    index = Path(markdown_dir, "ExampleRSTFile.md").read_text(encoding="utf-8")
+    assert index.startswith("# Example .rst File\n")
+    split_names = [name for name in os.listdir(markdown_dir) if name.startswith("ExampleRSTFile.")]
+    assert len(split_names) > 2
+    # The index has the anchors of each file
+    anchor_files = {}
+    for line in index.splitlines()[2:]:
+        name = re.search(r"\]\(([^)]+)\)$", line).group(1)
+        anchor_files.update(dict.fromkeys(re.findall(r'<a id="([^"]+)"></a>', line), name))
+    assert anchor_files["heading-levels"] in split_names
+
+    for name in split_names:
+        text = Path(markdown_dir, name).read_text(encoding="utf-8")
+        # Links to anchors in other files of the document point to their file
+        for anchor in re.findall(r"\]\(#([^)]+)\)", text):
+            assert anchor_files.get(anchor, name) == name
+
+    _rm_build_path(build_path)
+
+
+def test_split_links(tmp_path):
+    """Test that the links to the anchors of a split document point into the file of their anchor"""
+    index_source = "Index\n=====\n\nSee :ref:`one` and :ref:`three`.\n\n.. _after:\n\nAfter\n-----\n\nText.\n"
+    srcdir = _write_sources(tmp_path, {"index": index_source})
+    outdir = tmp_path / "markdown"
+
+    def write_big(text: str):
+        sections = "".join(f".. _{name}:\n\n{name.title()}\n-----\n\n{text}\n\n" for name in ("one", "two", "three"))
+        (srcdir / "big.rst").write_text(f"Big\n===\n\n{sections}", encoding="utf-8")
+
+    overrides = {
+        "markdown_split_size": 1000,
+        "markdown_anchor_sections": True,
+        "markdown_offset_index": True,
+        "markdown_sections_jsonl": "sections.jsonl",
+        "markdown_journal": "journal.json",
+    }
+
+    def build():
+        build_app(str(tmp_path), overrides, srcdir)
+        index = (outdir / "index.md").read_text(encoding="utf-8")
+        records = _read_section_records(str(outdir / "sections.jsonl"))
+        journal = json.loads((outdir / "journal.json").read_text(encoding="utf-8"))
+        return index, records, journal
+
+    def check_offsets(index: str):
+        """The offsets after the rewritten links are shifted"""
+        offsets = json.loads((outdir / "index.md.offsets.json").read_text(encoding="utf-8"))
+        data = index.encode("utf-8")
+        spans = {name: data[start:][:length] for name, (start, length) in offsets["anchors"].items()}
+        assert spans == {anchor: f'<a id="{anchor}"></a>'.encode("utf-8") for anchor in spans}
+        assert [data[start:][:length] for _, start, length in offsets["titles"]] == [b"# Index", b"## After"]
+
+    write_big("Text. " * 100)
+    index, records, journal = build()
+    big_index = (outdir / "big.md").read_text(encoding="utf-8")
+    # The first file that has the anchor, same as the links within the document
+    anchor_files = {}
+    for line in big_index.splitlines()[2:]:
+        name = re.search(r"\]\(([^)]+)\)$", line).group(1)
+        for anchor in re.findall(r'<a id="([^"]+)"></a>', line):
+            anchor_files.setdefault(anchor, name)
+    assert anchor_files["one"] != anchor_files["three"]
+    for anchor in ("one", "three"):
+        link = f"]({anchor_files[anchor]}#{anchor})"
+        assert link in index
+        assert any(link in record["body"] for record in records if record["docname"] == "index")
+    check_offsets(index)
+    assert journal["hashes"]["index.md"] != hash_content(index.replace(anchor_files["one"], "big.md"))
+
+    # Once the document is not split anymore, the links (of the documents that are not written again) point to it
+    write_big("Text.")
+    index, records, journal = build()
+    assert "](big.md#one)" in index and "](big.md#three)" in index
+    assert "index.md" in journal["modified"]
+    check_offsets(index)
+    assert anchor_files["one"] in journal["deleted"]
+    assert journal["hashes"]["index.md"] == hash_content(index)
+
+
+def _read_section_records(path: str):
+    with open(path, encoding="utf-8") as file:
+        return sorted((json.loads(line) for line in file), key=lambda record: (record["docname"], record["body"]))
+
+
+def test_sections_jsonl():
+    """Test that the section records are the same in serial, parallel, and incremental builds"""
+    serial_path = os.path.join(BUILD_PATH, "test_jsonl_serial")
+    parallel_path = os.path.join(BUILD_PATH, "test_jsonl_parallel")
+    _rm_build_path(serial_path)
+    _rm_build_path(parallel_path)
+    flags = ["-D", "markdown_sections_jsonl=sections.jsonl"]
+
+    run_sphinx(serial_path, "-a", *flags)
+    records = _read_section_records(os.path.join(serial_path, "markdown", "sections.jsonl"))
+    assert {"docname": "index", "ids": ["main-test-file"], "titles": ["Main Test File"], "level": 1}.items() <= (
+        next(record for record in records if record["docname"] == "index").items()
+    )
+
+    run_sphinx(parallel_path, "-a", "-j", "4", *flags)
+    _touch_sources()
+    run_sphinx(parallel_path, "-j", "4", *flags)
+    assert _read_section_records(os.path.join(parallel_path, "markdown", "sections.jsonl")) == records
+    assert not [name for name in os.listdir(os.path.join(parallel_path, "markdown")) if name.endswith(".part")]
+
+    _rm_build_path(serial_path)
+    _rm_build_path(parallel_path)
+
+
+def test_offset_index():
+    """Test that the offset index maps the anchors and the titles to their bytes in the markdown files"""
+    build_path = os.path.join(BUILD_PATH, "test_offsets")
+    _rm_build_path(build_path)
+    run_sphinx(build_path, "-a", "-D", "markdown_offset_index=1", "-D", "markdown_anchor_sections=1")
+
+    markdown_dir = os.path.join(build_path, "markdown")
+    with open(os.path.join(markdown_dir, "ExampleRSTFile.md.offsets.json"), encoding="utf-8") as file:
+        offset_index = json.load(file)
+    data = Path(markdown_dir, "ExampleRSTFile.md").read_bytes()
+
+    assert len(offset_index["anchors"]) > 10
+    for anchor, (offset, length) in offset_index["anchors"].items():
+        assert f'<a id="{anchor}">' in data[offset:][:length].decode("utf-8")
+    title, offset, length = offset_index["titles"][0]
+    assert data[offset:][:length].decode("utf-8") == f"# {title}"
+
+    _rm_build_path(build_path)
+
+
+def _read_archive(path: str) -> Dict[str, str]:
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name).decode("utf-8") for name in archive.namelist()}
+    with tarfile.open(path, "r:gz") as archive:
+        return {member.name: archive.extractfile(member).read().decode("utf-8") for member in archive}
+
+
+def test_archive():
+    """Test that the archive has the same files as the output directory, in parallel and incremental builds"""
+    files_path = os.path.join(BUILD_PATH, "test_archive_files")
+    archive_path = os.path.join(BUILD_PATH, "test_archive")
+    _rm_build_path(files_path)
+    _rm_build_path(archive_path)
+
+    run_sphinx(files_path, "-a")
+    outputs = _read_outputs(os.path.join(files_path, "markdown"))
+    outputs = {name.replace(os.path.sep, "/"): output for name, output in outputs.items()}
+
+    for archive_name, flags in (("docs.zip", ["-j", "4"]), ("docs.tar.gz", [])):
+        flags = [*flags, "-D", f"markdown_archive={archive_name}"]
+        run_sphinx(archive_path, "-a", *flags)
+        _touch_sources()
+        run_sphinx(archive_path, *flags)
+        assert _read_archive(os.path.join(archive_path, "markdown", archive_name)) == outputs
+
+    assert sorted(os.listdir(os.path.join(archive_path, "markdown"))) == ["docs.tar.gz", "docs.zip"]
+
+    _rm_build_path(files_path)
+    _rm_build_path(archive_path)
+
+
+def test_copy_assets():
+    """Test that the images and the downloads are copied, and that the markdown files reference the copies"""
+    build_path = os.path.join(BUILD_PATH, "test_assets")
+    _rm_build_path(build_path)
+    run_sphinx(build_path, "-a", "-j", "4", "-D", "markdown_copy_assets=1")
+
+    markdown_dir = os.path.join(build_path, "markdown")
+    image_path = os.path.join(markdown_dir, "_images", "markdown.png")
+    assert Path(image_path).read_bytes() == Path(SOURCE_PATH, "static", "markdown.png").read_bytes()
+    output = Path(markdown_dir, "image-target.md").read_text(encoding="utf-8")
+    assert "![image](_images/markdown.png)" in output
+
+    (download_link,) = re.findall(r"\]\((_downloads/[^)]+)\)", output)
+    # The download is the same file as the image
+    assert os.path.samefile(image_path, os.path.join(markdown_dir, *download_link.split("/")))
+
+    _rm_build_path(build_path)
+
+
+def test_compact_references_after_html_build(tmp_path):
+    """Test that the references of the documents that an HTML build read again are collected again"""
+    sources = {
+        "index": "Index\n=====\n\n.. toctree::\n\n   a\n   b\n",
+        "a": "A\n=\n\nSee :ref:`label1`.\n",
+        "b": "B\n=\n\n.. _label1:\n\nOne\n---\n\n.. _label2:\n\nTwo\n---\n",
+    }
+    srcdir = _write_sources(tmp_path, sources)
+    build_path = str(tmp_path / "build")
+    overrides = {"markdown_compact": True, "markdown_anchor_sections": True}
+    build_app(build_path, overrides, srcdir)
+
+    # Modified before the HTML build, which reads it again
+    (srcdir / "a.rst").write_text("A\n=\n\nSee :ref:`label2`.\n", encoding="utf-8")
+    flags = ["-q", "-D", "markdown_compact=1", "-D", "markdown_anchor_sections=1"]
+    assert main(["-M", "html", str(srcdir), build_path, *flags]) == 0
+    build_app(build_path, overrides, srcdir, force_all=True)
+
+    markdown_dir = tmp_path / "build" / "markdown"
+    assert "b.md#label2" in (markdown_dir / "a.md").read_text(encoding="utf-8")
+    assert '<a id="label2"></a>' in (markdown_dir / "b.md").read_text(encoding="utf-8")
+
+
+def test_sharded_build():
+    """Test that the merged output of the shards is the same as the output of a single build"""
+    full_path = os.path.join(BUILD_PATH, "test_shards_full")
+    shards_path = os.path.join(BUILD_PATH, "test_shards")
+    _rm_build_path(full_path)
+    _rm_build_path(shards_path)
+
+    # The journals of the shards are merged
+    run_sphinx(full_path, "-a", "-D", "markdown_journal=journal.json")
+    shard_dirs = []
+    for index in range(1, 4):
+        shard_path = os.path.join(shards_path, str(index))
+        run_sphinx(
+            shard_path, "-a", "-j", "2", "-D", f"markdown_shard={index}/3", "-D", "markdown_journal=journal.json"
+        )
+        shard_dirs.append(os.path.join(shard_path, "markdown"))
+
+    merged_path = os.path.join(shards_path, "merged")
+    assert merge_shards(shard_dirs, merged_path) == []
+    assert _read_outputs(merged_path) == _read_outputs(os.path.join(full_path, "markdown"))
+
+    # A missing shard is reported, and so are the links to its documents
+    os.remove(os.path.join(shard_dirs[0], MANIFEST_NAME))
+    with open(os.path.join(shard_dirs[1], MANIFEST_NAME), encoding="utf-8") as file:
+        missing_docnames = len(json.load(file)["all_docnames"])
+    problems = merge_shards(shard_dirs[1:], os.path.join(shards_path, "partial"))
+    assert problems[0] == "expected shards 1 to 3, got: 2, 3"
+    assert problems[1].endswith(f"out of {missing_docnames}")
+
+    # The merge reads the shards' output trees, not archives
+    with pytest.raises(ConfigError):
+        make_app(os.path.join(shards_path, "archive"), {"markdown_shard": "1/3", "markdown_archive": "out.zip"})
+
+    _rm_build_path(full_path)
+    _rm_build_path(shards_path)
+
+
+def test_size_budget(capsys):
+    """Test that a document with too many elements is rendered as plain text, with a warning"""
+    build_path = os.path.join(BUILD_PATH, "test_size_budget")
+    _rm_build_path(build_path)
+    run_sphinx(build_path, "-a", "-D", "markdown_doc_size_limit=400")
+
+    warnings = re.findall(r"(\S+) exceeded the size budget \(at a (\w+) element\)", capsys.readouterr().err)
+    assert warnings == [("ExampleRSTFile", "table")]
+    output = Path(build_path, "markdown", "ExampleRSTFile.md").read_text(encoding="utf-8")
+    assert output.startswith("# Example .rst File\n\n```\n")
+
+    _rm_build_path(build_path)
+
+
+def test_check_links(capsys):
+    """Test that the links to anchors that were not added are reported, also by incremental builds"""
+    build_path = os.path.join(BUILD_PATH, "test_check_links")
+    _rm_build_path(build_path)
+    # The signatures' anchors are only added with markdown_anchor_signatures (and the modules' with the sections')
+    run_sphinx(build_path, "-D", "markdown_check_links=1")
+    broken = re.findall(r"broken link to (\S+) \(no such anchor\)", capsys.readouterr().err)
+    assert "library/my_module.md#my_module.func1" in broken
+    # The sections' links are to the anchors of their headings
+    assert not any("ExampleRSTFile.md#" in link for link in broken)
+
+    run_sphinx(build_path, "-D", "markdown_check_links=1")
+    assert re.findall(r"broken link to (\S+) \(no such anchor\)", capsys.readouterr().err) == broken
+
+    flags = ["-D", "markdown_anchor_sections=1", "-D", "markdown_anchor_signatures=1"]
+    run_sphinx(build_path, "-a", "-D", "markdown_check_links=1", *flags)
+    assert "broken link" not in capsys.readouterr().err
+
+    _rm_build_path(build_path)
+
+
+def test_journal(tmp_path):
+    """Test that the journal lists the changed files, and that the files of removed documents are deleted"""
+    srcdir = _write_sources(tmp_path, {name: f"{name.title()}\n=====\n" for name in ("index", "changed", "removed")})
+
+    def build():
+        build_app(str(tmp_path), {"markdown_journal": "journal.json"}, srcdir)
+        return json.loads((tmp_path / "markdown" / "journal.json").read_text(encoding="utf-8"))
+
+    journal = build()
+    assert journal["created"] == ["changed.md", "index.md", "removed.md"]
+
+    (srcdir / "changed.rst").write_text("Changed\n=====\n\nText.\n", encoding="utf-8")
+    os.utime(srcdir / "changed.rst", (0, os.path.getmtime(srcdir / "changed.rst") + 10))
+    (srcdir / "removed.rst").unlink()
+    (srcdir / "added.rst").write_text("Added\n=====\n", encoding="utf-8")
+    journal = build()
+    assert {kind: journal[kind] for kind in ("created", "modified", "deleted", "unchanged")} == {
+        "created": ["added.md"],
+        "modified": ["changed.md"],
+        "deleted": ["removed.md"],
+        "unchanged": ["index.md"],
+    }
+    assert sorted(journal["hashes"]) == ["added.md", "changed.md", "index.md"]
+    assert not (tmp_path / "markdown" / "removed.md").exists()
+
+
+def test_hashes_only_for_journal(tmp_path, monkeypatch):
+    """Test that the output files are hashed only for the journal"""
+    hashed = []
+    monkeypatch.setattr("sphinx_markdown_builder.journal.hash_content", lambda text: hashed.append(text) or "")
+    run_sphinx(str(tmp_path), "-D", "markdown_split_size=2000", "-D", "markdown_offset_index=1")
+    assert not hashed
+    run_sphinx(str(tmp_path), "-E", "-D", "markdown_split_size=2000", "-D", "markdown_journal=journal.json")
+    assert hashed
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"markdown_offset_index": True},
+        {"markdown_archive": "out.zip"},
+        {"markdown_archive": "out.zip", "markdown_journal": "journal.json"},
+    ],
+    ids=["files", "archive", "archive-journal"],
+)
+def test_removed_outputs(tmp_path, overrides):
+    """Test that the output files of removed documents are deleted, with or without the journal"""
+    srcdir = _write_sources(tmp_path, {name: f"{name.title()}\n=====\n" for name in ("index", "removed")})
+    outdir = tmp_path / "markdown"
+
+    def build():
+        build_app(str(tmp_path), overrides, srcdir)
+        if "markdown_archive" not in overrides:
+            return sorted(path.name for path in outdir.iterdir())
+        with zipfile.ZipFile(outdir / "out.zip") as archive:
+            return sorted(archive.namelist())
+
+    assert "removed.md" in build()
+    (srcdir / "removed.rst").unlink()
+    outputs = build()
+    assert "index.md" in outputs
+    assert not [name for name in outputs if name.startswith("removed.")]
+    # The output records are only kept for the journal
+    assert (tmp_path / "doctrees" / "markdown-outputs.jsonl").exists() == ("markdown_journal" in overrides)
+
+
+def test_large_tables():
+    """Test that the tables with more rows than the limit are rendered as HTML"""
+    build_path = os.path.join(BUILD_PATH, "test_large_tables")
+    _rm_build_path(build_path)
+
+    build_app(build_path, {"markdown_large_tables": {"rows": 3}}, force_all=True)
+    example = Path(build_path, "markdown", "ExampleRSTFile.md").read_text(encoding="utf-8")
+    # The tables with up to 3 rows are kept as they are
+    assert "<table>" in example and "|----" in example
+    assert "<tr><th>\n\nMap ID\n\n</th><th>\n\nDocument\n\n</th></tr>" in example
+
+    with pytest.raises(ConfigError):
+        make_app(build_path, {"markdown_large_tables": {"rows": 3, "format": "csv"}})
+
+    _rm_build_path(build_path)
+
+
+def test_node_rules():
+    """Test that the configured rules override the rendering of the element types"""
+    build_path = os.path.join(BUILD_PATH, "test_node_rules")
+    _rm_build_path(build_path)
+    node_rules = {"table": "skip", "literal_block": "raw", "glossary": "passthrough"}
+    app = build_app(build_path, {"markdown_node_rules": node_rules}, force_all=True)
+    assert "table" in app.builder.skipped_elements
+
+    markdown_dir = os.path.join(build_path, "markdown")
+    example = Path(markdown_dir, "ExampleRSTFile.md").read_text(encoding="utf-8")
+    # No table rows or code fences
+    assert not re.search(r"^(\||```)", example, re.MULTILINE)
+    assert "Glossary2-Term2" in Path(markdown_dir, "glossaries.md").read_text(encoding="utf-8")
+
+    with pytest.raises(ConfigError):
+        make_app(build_path, {"markdown_node_rules": {"table": "drop"}})
+
+    _rm_build_path(build_path)
+
+
+def test_compact():
+    """Test that the compact output keeps the anchors that are linked to"""
+    build_path = os.path.join(BUILD_PATH, "test_compact")
+    _rm_build_path(build_path)
+    flags = ["-D", "markdown_anchor_sections=1", "-D", "markdown_anchor_signatures=1"]
+    run_sphinx(os.path.join(build_path, "full"), *flags)
+    run_sphinx(os.path.join(build_path, "compact"), *flags, "-D", "markdown_compact=1")
+
+    full = _read_outputs(os.path.join(build_path, "full", "markdown"))
+    compact = _read_outputs(os.path.join(build_path, "compact", "markdown"))
+    assert full.keys() == compact.keys()
+    assert sum(map(len, compact.values())) < sum(map(len, full.values()))
+    assert "|---|---|" in compact["ExampleRSTFile.md"]
+
+    anchors = {name: set(re.findall(r"<a id=[\"']([^\"']+)[\"']>", content)) for name, content in compact.items()}
+    for name, content in compact.items():
+        for path, anchor in re.findall(r"\]\(([^)#\s]*)#([^)\s]+)\)", content):
+            target = os.path.normpath(os.path.join(os.path.dirname(name), path)) if path else name
+            if target in anchors:
+                assert anchor in anchors[target], f"{name}: {path}#{anchor}"
+    assert len(anchors["ExampleRSTFile.md"]) < full["ExampleRSTFile.md"].count("<a id=")
+
+    # The HTML build does not collect the references, so they are collected from the pickled doctrees
+    shared_path = os.path.join(build_path, "shared")
+    assert main(["-M", "html", SOURCE_PATH, shared_path, *flags, "-D", "markdown_compact=1", "-q"]) == 0
+    with open(os.path.join(shared_path, "doctrees", "environment.pickle"), "rb") as file:
+        assert not hasattr(pickle.load(file), "markdown_references")
+    run_sphinx(shared_path, *flags, "-D", "markdown_compact=1")
+    assert _read_outputs(os.path.join(shared_path, "markdown")) == compact
+
+    _rm_build_path(build_path)
@@ -0,0 +1,108 @@
+"""
+Tests for the watch mode, which rebuilds the changed documents and serves them
+"""
+
+import json
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+
+from sphinx_markdown_builder.daemon import MarkdownDaemon, parse_args, scan_tree
+
+CONF = 'extensions = ["sphinx_markdown_builder"]\n'
+INDEX = """
+Index
+=====
+
+.. toctree::
+
+   page
+"""
+PAGE = """
+Page
+====
+
+First version.
+"""
+
+
+def _bump_mtime(path):
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture(name="daemon")
+def fixture_daemon(tmp_path):
+    srcdir = tmp_path / "source"
+    srcdir.mkdir()
+    (srcdir / "conf.py").write_text(CONF, encoding="utf-8")
+    (srcdir / "index.rst").write_text(INDEX, encoding="utf-8")
+    (srcdir / "page.rst").write_text(PAGE, encoding="utf-8")
+    return MarkdownDaemon(str(srcdir), str(srcdir / "_build"), quiet=True)
+
+
+def test_scan_tree(tmp_path):
+    (tmp_path / "a.rst").write_text("a")
+    for skipped in (".git", "__pycache__", "build"):
+        (tmp_path / skipped).mkdir()
+        (tmp_path / skipped / "b.rst").write_text("b")
+    assert list(scan_tree(str(tmp_path), {str(tmp_path / "build")})) == [str(tmp_path / "a.rst")]
+
+
+def test_rebuild_on_change(daemon):
+    assert daemon.poll()
+    assert daemon.status.state == "succeeded"
+    assert sorted(daemon.status.written) == ["index", "page"]
+    assert not daemon.poll()
+
+    page_path = os.path.join(daemon.srcdir, "page.rst")
+    with open(page_path, "w", encoding="utf-8") as file:
+        file.write(PAGE.replace("First", "Second"))
+    _bump_mtime(page_path)
+    assert daemon.poll()
+    assert daemon.status.builds == 2
+    # Sphinx also writes the documents that include it in their toctree
+    assert sorted(daemon.status.written) == ["index", "page"]
+    assert daemon.read_output("/page.md") == b"# Page\n\nSecond version.\n"
+
+    # A configuration change creates the application again
+    app = daemon.app
+    with open(daemon.conf_path, "a", encoding="utf-8") as file:
+        file.write('markdown_bullet = "-"\n')
+    _bump_mtime(daemon.conf_path)
+    assert daemon.poll()
+    assert daemon.app is not app
+    assert daemon.read_output("/index.md").endswith(b"- [Page](page.md)\n")
+
+
+def test_serve(daemon):
+    daemon.poll()
+    server = daemon.serve()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with urllib.request.urlopen(f"{base_url}/_status") as response:
+            assert json.load(response)["state"] == "succeeded"
+        with urllib.request.urlopen(f"{base_url}/") as response:
+            assert response.headers["Content-Type"].startswith("text/markdown")
+            assert response.read() == daemon.read_output("/index.md")
+        for path in ("/missing.md", "/../conf.py"):
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{base_url}{path}")  # pylint: disable=consider-using-with
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_parse_overrides(capsys):
+    """The markdown configuration values are converted, and Sphinx's own are passed on as strings"""
+    overrides = ["-D", "markdown_split_size=100", "-D", "markdown_compact=1", "-D", "project=P"]
+    args = parse_args(["source", "build", *overrides])
+    assert args.overrides == {"markdown_split_size": 100, "markdown_compact": True, "project": "P"}
+
+    for override in ("markdown_compact=yess", "markdown_split_size=x", "markdown_node_rules=table", "project"):
+        with pytest.raises(SystemExit) as exc_info:
+            parse_args(["source", "build", "-D", override])
+        assert exc_info.value.code == 2
+        assert "sphinx-markdown-daemon: error:" in capsys.readouterr().err
@@ -0,0 +1,93 @@
+"""
+Tests for the in-memory rendering
+"""
+
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sphinx.application import Sphinx
+
+from sphinx_markdown_builder.builder import MarkdownBuilder
+from sphinx_markdown_builder.render import MarkdownRenderer
+
+SOURCE_PATH = "./tests/source"
+
+SOURCE = """
+Title
+=====
+
+See :doc:`image-target`, with **bold** and ``code``.
+"""
+
+
+def _make_app(tmp_path, builder_name: str) -> Sphinx:
+    app = Sphinx(
+        SOURCE_PATH,
+        SOURCE_PATH,
+        str(tmp_path / builder_name),
+        str(tmp_path / "doctrees"),
+        builder_name,
+        status=None,
+        warning=io.StringIO(),
+        freshenv=True,
+    )
+    app.build()
+    return app
+
+
+@pytest.fixture(name="app", scope="module")
+def fixture_app(tmp_path_factory):
+    return _make_app(tmp_path_factory.mktemp("render"), "markdown")
+
+
+def test_render_rst(app):
+    renderer = MarkdownRenderer(app)
+    assert renderer.builder is app.builder
+    expected = "# Title\n\nSee [Test Image With Target](image-target.md), with **bold** and `code`.\n"
+    assert renderer.render_rst(SOURCE, "snippet") == expected
+
+    # The environment is not affected by the rendering
+    assert "snippet" not in app.env.all_docs
+    with ThreadPoolExecutor(4) as executor:
+        assert set(executor.map(lambda _: renderer.render_rst(SOURCE, "snippet"), range(20))) == {expected}
+
+
+def test_render_rst_isolated(app):
+    """The labels and titles of the parsed sources are removed from the environment, and the project's are kept"""
+    renderer = MarkdownRenderer(app)
+    labels = dict(app.env.domaindata["std"]["labels"])
+    titles = dict(app.env.titles)
+    source = ".. _anchor-for-examplerstfile:\n\nHijack\n------\n\n.. _new-label:\n\nNew\n---\n"
+    assert "# Hijack" in renderer.render_rst(source)
+    assert app.env.domaindata["std"]["labels"] == labels
+    assert app.env.titles == titles
+
+
+def test_render_doctree(app):
+    renderer = MarkdownRenderer(app)
+    doctree = app.env.get_and_resolve_doctree("image-target", app.builder, tags=app.tags)
+    with open(os.path.join(app.outdir, "image-target.md"), encoding="utf-8") as file:
+        assert renderer.render_doctree(doctree, "image-target") == file.read()
+
+
+def test_render_with_other_builder(tmp_path):
+    """The references are resolved by the application's builder"""
+    app = _make_app(tmp_path, "html")
+    renderer = MarkdownRenderer(app)
+    assert renderer.builder is not app.builder
+    assert "[Test Image With Target](image-target.html)" in renderer.render_rst(SOURCE, "snippet")
+    # The HTML build is not affected by the markdown builder's event handlers
+    for listeners in app.events.listeners.values():
+        for listener in listeners:
+            assert not isinstance(getattr(listener.handler, "__self__", None), MarkdownBuilder)
+
+
+def test_render_rst_as_built(app):
+    """The sources are parsed with the project's settings, the same as when they are read by the build"""
+    renderer = MarkdownRenderer(app)
+    with open(os.path.join(SOURCE_PATH, "image-target.rst"), encoding="utf-8") as file:
+        source = file.read()
+    with open(os.path.join(app.outdir, "image-target.md"), encoding="utf-8") as file:
+        assert renderer.render_rst(source, "image-target") == file.read()
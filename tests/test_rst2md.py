@@ -0,0 +1,95 @@
+"""
+Tests for the standalone reStructuredText conversion
+"""
+
+import pytest
+
+from sphinx_markdown_builder.rst2md import convert_files, main, parse_config_value, rst_to_markdown
+
+SOURCE = """
+Title
+=====
+
+Some *text* with ``code``.
+
+* item
+
+.. unknown-directive:: ignored
+"""
+
+
+def test_rst_to_markdown():
+    assert rst_to_markdown(SOURCE) == "# Title\n\nSome *text* with `code`.\n\n* item\n"
+    assert rst_to_markdown(SOURCE, {"markdown_anchor_sections": True}).startswith('<a id="title"></a>\n\n# Title')
+
+    with pytest.raises(ValueError):
+        rst_to_markdown(SOURCE, {"markdown_unknown": "-"})
+
+
+def test_parse_config_value():
+    assert parse_config_value("markdown_anchor_sections", "1") is True
+    assert parse_config_value("markdown_anchor_sections", "false") is False
+    assert parse_config_value("markdown_write_threads", "4") == 4
+    assert parse_config_value("markdown_flavor", "github") == "github"
+    assert parse_config_value("markdown_node_rules", '{"table": "skip"}') == {"table": "skip"}
+    assert parse_config_value("markdown_profiles", "[]") == []
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_files(tmp_path, jobs):
+    sources = []
+    for name in ("first", "second"):
+        source = tmp_path / f"{name}.rst"
+        source.write_text(SOURCE, encoding="utf-8")
+        sources.append(str(source))
+
+    output_dir = tmp_path / "out"
+    outputs = convert_files(sources, str(output_dir), jobs=jobs)
+    assert outputs == [str(output_dir / "first.md"), str(output_dir / "second.md")]
+    for output in outputs:
+        with open(output, encoding="utf-8") as file:
+            assert file.read() == rst_to_markdown(SOURCE)
+
+
+def test_main(tmp_path, capsys):
+    source = tmp_path / "readme.rst"
+    source.write_text(SOURCE, encoding="utf-8")
+    assert main([str(source), "-D", "markdown_file_suffix=.txt"]) == 0
+    assert capsys.readouterr().out.strip() == str(tmp_path / "readme.txt")
+    assert (tmp_path / "readme.txt").read_text(encoding="utf-8") == rst_to_markdown(SOURCE)
+
+
+def test_convert_files_keep_paths(tmp_path):
+    """Test that the files of the same name (in different directories) do not overwrite each other"""
+    sources = []
+    for directory in ("docs", "src"):
+        source = tmp_path / directory / "README.rst"
+        source.parent.mkdir()
+        source.write_text(SOURCE.replace("Title", directory.title()), encoding="utf-8")
+        sources.append(str(source))
+
+    output_dir = tmp_path / "out"
+    outputs = convert_files(sources, str(output_dir))
+    assert outputs == [str(output_dir / "docs" / "README.md"), str(output_dir / "src" / "README.md")]
+    assert (output_dir / "src" / "README.md").read_text(encoding="utf-8").startswith("# Src")
+
+
+@pytest.mark.parametrize(
+    "override",
+    [
+        "markdown_flavor",
+        "=github",
+        "markdown_unknown=1",
+        "markdown_write_threads=x",
+        "markdown_anchor_sections=yess",
+        "markdown_node_rules=table",
+        "markdown_node_rules=[]",
+    ],
+)
+def test_main_invalid_override(tmp_path, capsys, override):
+    source = tmp_path / "readme.rst"
+    source.write_text(SOURCE, encoding="utf-8")
+    with pytest.raises(SystemExit) as exc_info:
+        main([str(source), "-D", override])
+    assert exc_info.value.code == 2
+    assert "rst2md: error:" in capsys.readouterr().err
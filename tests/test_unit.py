@@ -1,21 +1,68 @@
 """
 Unit tests for the markdown builder
 """
+
+import dataclasses
 import logging
+import os
+import subprocess
+import sys
+from typing import List, Tuple
 from unittest.mock import Mock
 
 import docutils.nodes
+import docutils.utils
 import pytest
+import sphinx.addnodes
 import sphinx.util.logging
+from sphinx.util.parallel import make_chunks
 
-from sphinx_markdown_builder.contexts import SubContext
-from sphinx_markdown_builder.translator import MarkdownTranslator
+from sphinx_markdown_builder.assets import Asset, copy_assets
+from sphinx_markdown_builder.builder import (
+    MtimeIndex,
+    make_plain_doctree,
+    measure_doctree,
+    prune_elements,
+    schedule_by_cost,
+)
+from sphinx_markdown_builder.contexts import SubContext, TableContext, TableLimits, collapse_blank_lines
+from sphinx_markdown_builder.journal import make_journal
+from sphinx_markdown_builder.links import (
+    DocLinks,
+    SplitLinkRewriter,
+    find_broken_links,
+    get_anchor_files,
+    make_heading_slug,
+    resolve_link,
+)
+from sphinx_markdown_builder.sections import (
+    get_byte_offsets,
+    make_section_records,
+    make_split_index,
+    pack_parts,
+    shift_offset_index,
+    split_document,
+)
+from sphinx_markdown_builder.shards import find_dangling_links, get_doc_shard, parse_shard
+from sphinx_markdown_builder.translator import (
+    MarkdownTranslator,
+    RenderTimeExceeded,
+    SectionMark,
+    TranslatorSetup,
+    check_node_rules,
+    get_skipped_elements,
+    make_table_limits,
+)
 
 
-def make_mock():
+def make_mock(translator_setup=None):
     document = Mock(name="document")
     document.settings.language_code = "en"
     builder = Mock(name="builder")
+    builder.translator_setup = translator_setup
+    builder.config.markdown_node_rules = {}
+    builder.config.markdown_compact = False
+    builder.config.markdown_large_tables = {}
     return MarkdownTranslator(document, builder)
 
 
@@ -75,3 +122,447 @@ def test_problematic():
         mt.dispatch_visit(node)
     mt.add("suffix")
     assert mt.astext() == "prefix\n\n```\ntext\n```\n\nsuffix\n"
+
+
+def test_table_context():
+    ctx = TableContext()
+    ctx.add("title")
+    for is_head, rows in ((True, [["a", "b"]]), (False, [["c", "d\ne"], ["f", "g"]])):
+        ctx.enter_head() if is_head else ctx.enter_body()
+        for row in rows:
+            ctx.enter_row()
+            for cell in row:
+                ctx.enter_entry()
+                ctx.add(cell)
+                ctx.exit_entry()
+            ctx.exit_row()
+        ctx.exit_head() if is_head else ctx.exit_body()
+
+    assert ctx.cells == ["a", "b", "c", "d<br/>e", "f", "g"]
+    assert list(ctx.iter_rows()) == [["a", "b"], ["c", "d<br/>e"], ["f", "g"]]
+    assert ctx.make() == "title\n\n| a   | b       |\n|-----|---------|\n| c   | d<br/>e |\n| f   | g       |"
+
+
+def test_large_tables():
+    assert make_table_limits({}) is None
+    assert make_table_limits({"rows": 2, "bytes": 10, "format": "split"}) == TableLimits(2, 0, 10, "split")
+    for value in ({"lines": 2}, {"rows": -1}, {"rows": "2"}, {"format": "csv"}):
+        with pytest.raises(ValueError):
+            make_table_limits(value)
+
+    headers = ["a", "b"]
+    rows = [["c", "d"], ["e", "f"], ["g", "h"]]
+    assert list(TableLimits(rows=2).split(rows)) == [rows[:2], rows[2:]]
+    assert list(TableLimits(size=3).split(rows)) == [[row] for row in rows]
+
+    ctx = TableContext(compact=True, limits=TableLimits(rows=2, format="split"))
+    assert ctx.make_table(headers, rows) == "|a|b|\n|---|---|\n|c|d|\n|e|f|\n\n|a|b|\n|---|---|\n|g|h|"
+    ctx = TableContext(limits=TableLimits(cells=4))
+    assert ctx.make_table(headers, rows[:2]) == "| a   | b   |\n|-----|-----|\n| c   | d   |\n| e   | f   |"
+    # The cells' content is separated by blank lines, so it is rendered as markdown
+    assert ctx.make_table(headers, [*rows[:2], ["**i**", ""]]).split("\n") == [
+        "<table>",
+        "<thead>",
+        "<tr><th>",
+        "",
+        "a",
+        "",
+        "</th><th>",
+        "",
+        "b",
+        "",
+        "</th></tr>",
+        "</thead>",
+        "<tbody>",
+        "<tr><td>",
+        "",
+        "c",
+        "",
+        "</td><td>",
+        "",
+        "d",
+        "",
+        "</td></tr>",
+        "<tr><td>",
+        "",
+        "e",
+        "",
+        "</td><td>",
+        "",
+        "f",
+        "",
+        "</td></tr>",
+        "<tr><td>",
+        "",
+        "**i**",
+        "",
+        "</td><td></td></tr>",
+        "</tbody>",
+        "</table>",
+    ]
+
+
+def _make_table_ctx(limits: TableLimits, rows: List[List[str]]) -> Tuple[str, int]:
+    """Returns the rendered table, and the most cells that the context kept"""
+    ctx = TableContext(compact=True, limits=limits)
+    kept = 0
+    ctx.enter_body()
+    for row in rows:
+        ctx.enter_row()
+        for cell in row:
+            ctx.enter_entry()
+            ctx.add(cell)
+            ctx.exit_entry()
+        ctx.exit_row()
+        kept = max(kept, len(ctx.cells))
+    ctx.exit_body()
+    return ctx.make(), kept
+
+
+@pytest.mark.parametrize(
+    "limits", [TableLimits(rows=2), TableLimits(size=5, format="split"), TableLimits(rows=2, format="split")]
+)
+def test_large_tables_streamed(limits):
+    """The rows of a large table are rendered once it exceeds its limits, so the whole table is not kept"""
+    headers = ["a", "b"]
+    rows = [[f"c{index}", f"d{index}"] for index in range(10)]
+    table, kept = _make_table_ctx(limits, [headers, *rows])
+    assert table == TableContext(compact=True, limits=limits).make_table(headers, rows)
+    assert kept <= 4 * len(headers)
+
+
+def test_schedule_by_cost():
+    costs = {"huge": 100, "big": 50, **{f"small{i}": 1 for i in range(10)}}
+    docnames = sorted(costs)
+    scheduled = schedule_by_cost(docnames, costs.get, 4)
+    assert sorted(scheduled) == docnames
+    # The cheapest document is written first by the main process
+    assert costs[scheduled[0]] == 1
+
+    # The expensive documents are dispatched first, each in its own chunk
+    chunks = make_chunks(scheduled[1:], 4)
+    assert chunks[0][0] == "huge"
+    assert chunks[1][0] == "big"
+    assert all(costs[doc] == 1 for chunk in chunks[2:] for doc in chunk)
+
+
+def test_mtime_index(tmp_path):
+    (tmp_path / "a.md").write_text("a")
+    (tmp_path / "sub").mkdir()
+    index = MtimeIndex()
+    assert index.get(str(tmp_path / "a.md")) == os.path.getmtime(tmp_path / "a.md")
+    assert index.get(str(tmp_path / "b.md")) is None
+    assert index.get(str(tmp_path / "sub")) is None
+    assert index.get(str(tmp_path / "missing" / "a.md")) is None
+
+    # The directory was scanned once
+    (tmp_path / "b.md").write_text("b")
+    assert index.get(str(tmp_path / "b.md")) is None
+
+
+def test_prune_elements():
+    skipped = get_skipped_elements(MarkdownTranslator)
+    assert "index" in skipped and "substitution_definition" in skipped
+
+    paragraph = docutils.nodes.paragraph("", "", docutils.nodes.Text("text"), sphinx.addnodes.index())
+    section = docutils.nodes.section("", sphinx.addnodes.index(), paragraph)
+    prune_elements(section, skipped)
+    assert section.children == [paragraph]
+    assert paragraph.astext() == "text"
+    assert len(paragraph.children) == 1
+
+    class CustomTranslator(MarkdownTranslator):
+        def visit_index(self, _node):
+            pass
+
+    assert "index" not in get_skipped_elements(CustomTranslator)
+
+
+def test_translator_setup():
+    config = Mock(
+        name="config",
+        author="Author",
+        version="1.0",
+        copyright=None,
+        markdown_node_rules={},
+        markdown_compact=False,
+        markdown_large_tables={},
+    )
+    setup = TranslatorSetup.from_config(config)
+    assert setup.doc_info == ('<meta name="author" content="Author"/>', '<meta name="version" content="1.0"/>')
+
+    mt = make_mock(setup)
+    assert mt.setup is setup
+    assert setup.get_language("en") is mt.language
+    mt.add("text")
+    assert mt.astext() == '<meta name="author" content="Author"/>\n<meta name="version" content="1.0"/>\n\ntext\n'
+
+
+def _make_budget_doctree():
+    document = docutils.utils.new_document("test")
+    rows = [docutils.nodes.list_item("", docutils.nodes.paragraph("", f"item {i}")) for i in range(3)]
+    document += docutils.nodes.section(
+        "",
+        docutils.nodes.title("", "Title"),
+        docutils.nodes.paragraph("", "text"),
+        docutils.nodes.bullet_list("", *rows),
+        ids=["title"],
+    )
+    return document
+
+
+def test_measure_doctree():
+    size, largest = measure_doctree(_make_budget_doctree())
+    assert (size, largest) == (11, "bullet_list")
+
+
+def test_make_plain_doctree():
+    plain_doctree = make_plain_doctree(_make_budget_doctree())
+    section = plain_doctree[0]
+    assert section["ids"] == ["title"]
+    assert section[0].astext() == "Title"
+    assert section[1].astext() == "text\n\nitem 0\n\nitem 1\n\nitem 2"
+
+
+def test_render_deadline():
+    document = _make_budget_doctree()
+    mt = make_mock()
+    mt.deadline = 0
+    with pytest.raises(RenderTimeExceeded) as exc_info:
+        document.walkabout(mt)
+    assert exc_info.value.node is document
+
+
+def test_render_deadline_on_departure():
+    """The deadline is checked after departing each element too, e.g., after rendering a large table"""
+    document = _make_budget_doctree()
+    mt = make_mock(TranslatorSetup())
+    mt.deadline = float("inf")
+
+    def slow_departure(_node):
+        mt.deadline = 0
+
+    mt.depart_section = slow_departure
+    with pytest.raises(RenderTimeExceeded) as exc_info:
+        document.walkabout(mt)
+    assert isinstance(exc_info.value.node, docutils.nodes.section)
+
+
+def test_node_rules():
+    assert check_node_rules({"graphviz": "skip", "table": "raw"}) == {"graphviz": "skip", "table": "raw"}
+    with pytest.raises(ValueError):
+        check_node_rules({"graphviz": "drop"})
+
+    setup = TranslatorSetup(node_rules={"strong": "passthrough", "emphasis": "raw", "table": "skip"})
+    paragraph = docutils.nodes.paragraph(
+        "",
+        "",
+        docutils.nodes.strong("", "strong"),
+        docutils.nodes.Text(" and "),
+        docutils.nodes.emphasis("", "*emphasis*"),
+    )
+    table = docutils.nodes.table("", docutils.nodes.tgroup(cols=1))
+    document = docutils.utils.new_document("test")
+    document += [paragraph, table]
+    mt = make_mock(setup)
+    document.walkabout(mt)
+    assert mt.astext() == "strong and \\*emphasis\\*\n"
+
+    class custom_strong(docutils.nodes.strong):  # pylint: disable=invalid-name
+        """An extension's element, which is rendered by the handlers of its base class (unless it has a rule)"""
+
+    document = docutils.utils.new_document("test")
+    document += docutils.nodes.paragraph(
+        "", "", custom_strong("", "a"), docutils.nodes.Text(" "), custom_strong("", "b")
+    )
+    mt = make_mock(TranslatorSetup())
+    document.walkabout(mt)
+    assert mt.astext() == "**a** **b**\n"
+    mt = make_mock(TranslatorSetup(node_rules={"custom_strong": "passthrough"}))
+    document.walkabout(mt)
+    assert mt.astext() == "a b\n"
+
+
+def test_shared_handlers():
+    """The handlers are resolved once for all the translators of a setup, and each renders its own document"""
+    setup = TranslatorSetup()
+    texts = []
+    for text in ("first", "second"):
+        document = docutils.utils.new_document("test")
+        document += docutils.nodes.paragraph("", "", docutils.nodes.strong("", text))
+        mt = make_mock(setup)
+        document.walkabout(mt)
+        texts.append(mt.astext())
+    assert texts == ["**first**\n", "**second**\n"]
+    assert (MarkdownTranslator, docutils.nodes.strong) in setup.handlers
+    # The handlers depend on the node rules, so a replaced setup has its own
+    assert not dataclasses.replace(setup, node_rules={"strong": "skip"}).handlers
+
+
+def test_compact_output():
+    assert collapse_blank_lines("a\n\n\n \nb\n```\nc\n\n\nd\n```\n") == "a\n\nb\n```\nc\n\n\nd\n```\n"
+    assert TableContext.make_compact_table(["a", "b "], iter([["c", "d"]])) == "|a|b|\n|---|---|\n|c|d|"
+
+    setup = TranslatorSetup(compact=True, referenced_ids=frozenset({"a", "b"}))
+    document = docutils.utils.new_document("test")
+    document += docutils.nodes.section("", docutils.nodes.title("", "Title"), ids=["a", "b", "c"])
+    document += docutils.nodes.target(refid="a")
+    mt = make_mock(dataclasses.replace(setup, anchor_sections=True))
+    document.walkabout(mt)
+    assert mt.astext() == '<a id="a"></a>\n\n<a id="b"></a>\n\n# Title\n'
+
+
+def test_split_document():
+    assert pack_parts([5, 5, 5, 20, 5], 10) == [[0, 1], [2], [3], [4]]
+
+    parts = [
+        (SectionMark(0, 1, ["intro"], "Intro"), "# Intro\n\nSee [below](#details).\n"),
+        (SectionMark(5, 2, ["usage"], "Usage"), '## Usage\n\n<a id="example"></a>\n\nSee [intro](#intro).\n'),
+        (SectionMark(9, 2, ["details"], "Details"), "## Details\n\nSee [example](#example).\n"),
+    ]
+    files = split_document(parts, "doc", ".md", 110)
+    assert [split_file.name for split_file in files] == ["doc.1.md", "doc.2.md"]
+    assert files[0].anchors == ["intro", "usage", "example"]
+    assert "See [below](doc.2.md#details)." in files[0].text
+    assert "See [intro](#intro)." in files[0].text
+    assert files[1].text == "## Details\n\nSee [example](doc.1.md#example).\n"
+    # The sizes count the separators between the parts, and the rewritten links
+    assert pack_parts([5, 5, 5], 10, 1) == [[0], [1], [2]]
+    for max_size in range(61, 130):
+        for split_file in split_document(parts, "doc", ".md", max_size):
+            assert len(split_file.text.encode("utf-8")) <= max_size
+
+    index = make_split_index("Intro", files)
+    assert index.startswith("# Intro\n\n")
+    assert '* <a id="details"></a>[Details](doc.2.md)\n' in index
+
+
+def test_split_links():
+    index = {
+        "api/big": DocLinks(set(), [], parts={"big.1.md": ["a", "b"], "big.2.md": ["b", "c"]}),
+        "api/small": DocLinks(set(), []),
+        "guide": DocLinks(set(), []),
+    }
+    anchor_files = get_anchor_files(index)
+    assert anchor_files == {"api/big": {"a": "big.1.md", "b": "big.1.md", "c": "big.2.md"}}
+
+    rewriter = SplitLinkRewriter(set(index), anchor_files, ".md")
+    text = "[c](api/big.md#c) [x](api/big.md#x) [s](api/small.2.md#s) [b](api/big.2.md#b) [h](https://a.md#c)"
+    text, edits, targets = rewriter.rewrite("guide", text)
+    assert text == "[c](api/big.2.md#c) [x](api/big.md#x) [s](api/small.md#s) [b](api/big.1.md#b) [h](https://a.md#c)"
+    assert [edit[0] for edit in edits] == [2, 38, 60]
+    assert targets == {"api/big"}
+    assert rewriter.rewrite("api/small", "[c](big.md#c)")[0] == "[c](big.2.md#c)"
+
+    offset_index = {"anchors": {"a": [0, 5], "b": [10, 5]}, "titles": [["T", 20, 3]]}
+    assert shift_offset_index(offset_index, [(2, 2), (12, -1)]) == {
+        "anchors": {"a": [0, 7], "b": [12, 4]},
+        "titles": [["T", 21, 3]],
+    }
+
+
+def test_make_section_records():
+    parts = [
+        (None, "preamble\n"),
+        (SectionMark(0, 1, ["a"], "A"), "# A\n"),
+        (SectionMark(1, 2, ["b"], "B"), "## B\n\n×\n"),
+        (SectionMark(2, 2, ["c", "d"], "C"), "## C\n"),
+    ]
+    records = list(make_section_records("doc", parts))
+    assert [record["titles"] for record in records] == [[], ["A"], ["A", "B"], ["A", "C"]]
+    assert [record["level"] for record in records] == [0, 1, 2, 2]
+    assert records[2] == {
+        "docname": "doc",
+        "ids": ["b"],
+        "titles": ["A", "B"],
+        "level": 2,
+        "body": "## B\n\n×\n",
+        "length": 9,
+    }
+
+
+def test_get_byte_offsets():
+    assert get_byte_offsets("abc", [0, 2]) == {0: 0, 2: 2}
+    text = "a×b€c"
+    assert get_byte_offsets(text, [4, 1, 2, 4]) == {1: 1, 2: 3, 4: 7}
+    assert text.encode("utf-8")[3:7].decode("utf-8") == "b€"
+
+
+def test_copy_assets(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.png").write_bytes(b"same")
+    (src / "b.png").write_bytes(b"same")
+    (src / "c.png").write_bytes(b"diff")
+    assets = [Asset(str(src / name), f"_images/{name}") for name in ("a.png", "b.png", "c.png")]
+    outdirs = [str(tmp_path / "out1"), str(tmp_path / "out2")]
+
+    stats = copy_assets(assets, outdirs)
+    assert (stats.copied, stats.linked, stats.skipped) == (2, 4, 0)
+    assert (tmp_path / "out2" / "_images" / "b.png").read_bytes() == b"same"
+    assert os.path.samefile(tmp_path / "out1" / "_images" / "a.png", tmp_path / "out2" / "_images" / "b.png")
+    assert not os.path.samefile(tmp_path / "out1" / "_images" / "a.png", tmp_path / "out1" / "_images" / "c.png")
+
+    # Touching a source with the same content does not copy it again
+    os.utime(src / "c.png", (0, os.path.getmtime(src / "c.png") + 10))
+    stats = copy_assets(assets, outdirs)
+    assert (stats.copied, stats.linked, stats.skipped) == (0, 0, 6)
+
+    (src / "c.png").write_bytes(b"changed")
+    stats = copy_assets(assets, outdirs)
+    # Copied once, and linked again from the other output directory
+    assert (stats.copied, stats.linked, stats.skipped) == (1, 1, 4)
+    assert (tmp_path / "out2" / "_images" / "c.png").read_bytes() == b"changed"
+
+
+def test_parse_shard():
+    assert parse_shard("") is None
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "1", "a/b", "-1/4"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+    assert {get_doc_shard(f"doc{i}", 4) for i in range(100)} == {1, 2, 3, 4}
+    assert get_doc_shard("index", 4) == get_doc_shard("index", 4)
+
+
+def test_find_dangling_links(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "index.md").write_text("[a](sub/a.md#x) [b](b.md) [g](genindex.md) [w](https://x.org/b.md)")
+    (tmp_path / "sub" / "a.md").write_text("[i](../index.md) [c](c.md)")
+    problems = find_dangling_links(str(tmp_path), ["index", "sub/a", "b", "sub/c"], [".md"])
+    assert problems == ["index.md: dangling link to b.md", f"sub{os.sep}a.md: dangling link to c.md"]
+
+
+def test_find_broken_links():
+    assert make_heading_slug(" Tables & Code: 2nd_part ") == "tables--code-2nd_part"
+    assert resolve_link("a/b", "#x", ".md") == ("a/b", "x")
+    assert resolve_link("a/b", "../c.md#y%20z", ".md") == ("c", "y z")
+    for link in ("https://example.com/c.md#x", "mailto:a@b.md", "../_images/c.png"):
+        assert resolve_link("a/b", link, ".md") is None
+
+    index = {
+        "a/b": DocLinks({"x"}, ["#x", "#missing", "../c.md#y", "../c.md", "../genindex.md#z"]),
+        "c": DocLinks(set(), ["a/b.md#x", "d.md#unchecked"]),
+    }
+    assert find_broken_links(index, {"a/b", "c", "d"}, ".md") == [("a/b", "#missing"), ("a/b", "../c.md#y")]
+
+
+def test_make_journal():
+    previous = {"a.md": "1", "b.md": "2", "c.md": "3"}
+    journal = make_journal(previous, {"d.md": "4"}, {"a.md": "1", "b.md": "5", "d.md": "4", "e.md": "6"})
+    assert journal == {
+        "created": ["e.md"],
+        "modified": ["b.md"],
+        "deleted": ["c.md"],
+        "unchanged": ["a.md", "d.md"],
+        "hashes": {"a.md": "1", "b.md": "5", "d.md": "4", "e.md": "6"},
+    }
+
+
+def test_lazy_imports():
+    """Registering the extension should not load the translator, unless the markdown builder is used"""
+    code = "import sys, sphinx_markdown_builder; print(' '.join(sys.modules))"
+    modules = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout.split()
+    assert "sphinx_markdown_builder.builder" in modules
+    for module in ("sphinx_markdown_builder.translator", "sphinx_markdown_builder.contexts", "tabulate"):
+        assert module not in modules